@@ -0,0 +1,161 @@
+"""Read-only asset pack served under supernova://assets/.
+
+Build a pack from a directory with:
+
+    python assetpack.py build ASSET_DIR assets.pack
+"""
+
+import argparse
+import json
+import mimetypes
+import mmap
+import os
+import struct
+import sys
+from PyQt5.QtCore import QIODevice, QTimer
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from network import network_manager
+
+
+MAGIC = b"SNVPACK1"
+HEADER = struct.Struct("<8sQQ")   # magic, index offset, index length
+ALIGNMENT = 16
+SCHEME = "supernova"
+HOST = "assets"
+
+
+def build_pack(source, output):
+    """Pack every file below source into output; returns the number of files."""
+    entries = {}
+    partial = output + ".tmp"
+    with open(partial, "wb") as pack:
+        pack.write(b"\0" * HEADER.size)
+        for root, directories, names in os.walk(source):
+            directories.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, source).replace(os.sep, "/")
+                with open(path, "rb") as asset:
+                    data = asset.read()
+                pack.write(b"\0" * (-pack.tell() % ALIGNMENT))
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                entries[key] = [pack.tell(), len(data), content_type]
+                pack.write(data)
+
+        index = json.dumps(entries, separators=(",", ":"), sort_keys=True).encode()
+        index_offset = pack.tell()
+        pack.write(index)
+        pack.seek(0)
+        pack.write(HEADER.pack(MAGIC, index_offset, len(index)))
+    os.replace(partial, output)
+    return len(entries)
+
+
+class AssetPack(object):
+    """Memory-mapped pack file with its path index loaded at startup."""
+
+    def __init__(self, path):
+        with open(path, "rb") as pack:
+            self.mapping = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapping) < HEADER.size:
+            raise ValueError("%s is too short to be an asset pack" % path)
+        magic, index_offset, index_length = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not an asset pack" % path)
+        self.index = json.loads(self.mapping[index_offset:index_offset + index_length])
+
+    def lookup(self, path):
+        return self.index.get(path.lstrip("/"))
+
+
+class AssetReply(QNetworkReply):
+    """Reply reading an asset straight out of the pack's mapping."""
+
+    def __init__(self, operation, request, mapping, entry, parent=None):
+        super(AssetReply, self).__init__(parent)
+        self.setRequest(request)
+        self.setUrl(request.url())
+        self.setOperation(operation)
+        self.mapping = mapping
+        self.offset, self.length, content_type = entry if entry else (0, 0, None)
+        self.cursor = 0
+        self.done = False
+        self.open(QIODevice.ReadOnly | QIODevice.Unbuffered)
+
+        if entry is None:
+            self.setAttribute(QNetworkRequest.HttpStatusCodeAttribute, 404)
+            self.setError(QNetworkReply.ContentNotFoundError, "No such asset")
+        else:
+            self.setAttribute(QNetworkRequest.HttpStatusCodeAttribute, 200)
+            self.setHeader(QNetworkRequest.ContentTypeHeader, content_type)
+            self.setHeader(QNetworkRequest.ContentLengthHeader, self.length)
+            self.setRawHeader(b"Cache-Control", b"max-age=31536000, immutable")
+            self.setRawHeader(b"Access-Control-Allow-Origin", b"*")
+        QTimer.singleShot(0, self.deliver)
+
+    def deliver(self):
+        if self.done:
+            return
+        self.done = True
+        self.metaDataChanged.emit()
+        if self.error() != QNetworkReply.NoError:
+            self.error.emit(self.error())
+        elif self.operation() != QNetworkAccessManager.HeadOperation:
+            self.readyRead.emit()
+            self.downloadProgress.emit(self.length, self.length)
+        self.setFinished(True)
+        self.finished.emit()
+
+    def readData(self, maxlen):
+        count = min(maxlen, self.length - self.cursor)
+        start = self.offset + self.cursor
+        self.cursor += count
+        return self.mapping[start:start + count]
+
+    def bytesAvailable(self):
+        return self.length - self.cursor + super(AssetReply, self).bytesAvailable()
+
+    def isSequential(self):
+        return True
+
+    def abort(self):
+        self.cursor = self.length
+        if self.done:
+            return
+        self.done = True
+        self.setError(QNetworkReply.OperationCanceledError, "Operation canceled")
+        self.error.emit(QNetworkReply.OperationCanceledError)
+        self.setFinished(True)
+        self.finished.emit()
+
+
+class AssetSchemeHandler(object):
+    """Request handler answering supernova://assets/<path> from an AssetPack."""
+
+    def __init__(self, pack):
+        self.pack = pack
+
+    def handle(self, operation, request, data, forward):
+        url = request.url()
+        if url.scheme() != SCHEME or url.host() != HOST:
+            return forward(operation, request, data)
+        return AssetReply(operation, request, self.pack.mapping, self.pack.lookup(url.path()),
+                          network_manager())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a supernova asset pack.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="pack every file below a directory")
+    build.add_argument("source")
+    build.add_argument("output")
+    args = parser.parse_args(argv)
+
+    count = build_pack(args.source, args.output)
+    print("packed %d files into %s" % (count, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+from PyQt5.QtCore import QEvent, QObject, QPoint, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from metrics import metrics
+
+
+class NavbarAutoHide(QObject):
+    """Reveals the navbar when the pointer enters the top edge in fullscreen.
+
+    Mouse moves anywhere in the application are coalesced to at most one
+    hit-zone check per frame, and a single restartable timer hides the
+    navbar again once the pointer has left the zone.
+    """
+
+    HIT_ZONE = 40
+    HIDE_DELAY_MS = 1000
+    FRAME_MS = 16
+
+    def __init__(self, window, navbar, parent=None):
+        super(NavbarAutoHide, self).__init__(parent)
+        self.window = window
+        self.navbar = navbar
+        self.enabled = False
+        self.last_pos = QPoint()
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.check_pointer)
+
+        self.hide_timer = QTimer(self)
+        self.hide_timer.setSingleShot(True)
+        self.hide_timer.timeout.connect(self.navbar.hide)
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        app = QApplication.instance()
+        if enabled:
+            app.installEventFilter(self)
+        else:
+            app.removeEventFilter(self)
+            self.frame_timer.stop()
+            self.hide_timer.stop()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.MouseMove:
+            metrics.inc("navbar_mouse_events")
+            self.last_pos = event.globalPos()
+            if not self.frame_timer.isActive():
+                self.frame_timer.start(self.FRAME_MS)
+        return False
+
+    def check_pointer(self):
+        metrics.inc("navbar_pointer_checks")
+        if self.window.mapFromGlobal(self.last_pos).y() < self.HIT_ZONE:
+            self.hide_timer.stop()
+            self.navbar.show()
+        elif self.navbar.isVisible() and not self.hide_timer.isActive():
+            self.hide_timer.start(self.HIDE_DELAY_MS)
+            metrics.inc("navbar_hide_timer_starts")
@@ -0,0 +1,145 @@
+"""Compare the memory-mapped pack cache with QNetworkDiskCache.
+
+    python benchmarks/disk_cache.py --entries 2000
+
+Reports insert time, hit latency, hit ratio and storage cost (bytes
+written to the block layer, allocated blocks and file count) for the same
+workload, once with room to spare and once in a cache too small for it,
+where steady-state eviction and compaction dominate.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QDateTime, QUrl
+from PyQt5.QtNetwork import QNetworkCacheMetaData, QNetworkDiskCache
+
+from mappedcache import MappedDiskCache
+from memory import MB
+from metrics import metrics
+
+
+def written_bytes():
+    """Bytes this process caused to be written to storage, 0 if unknown."""
+    os.sync()
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def storage_usage(directory):
+    files = allocated = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            files += 1
+            allocated += os.stat(os.path.join(root, name)).st_blocks * 512
+    return files, allocated
+
+
+def workload(entries, seed=7):
+    rng = random.Random(seed)
+    for i in range(entries):
+        size = rng.choice((512, 2048, 8192, 32768))
+        yield QUrl("http://127.0.0.1:8005/asset/%d.js" % i), rng.randbytes(size)
+
+
+def metadata_for(url):
+    metadata = QNetworkCacheMetaData()
+    metadata.setUrl(url)
+    metadata.setSaveToDisk(True)
+    metadata.setExpirationDate(QDateTime.currentDateTime().addDays(1))
+    metadata.setRawHeaders([(b"Content-Type", b"application/javascript"),
+                            (b"Cache-Control", b"max-age=86400")])
+    return metadata
+
+
+def run(name, cache, directory, entries, lookups):
+    items = list(workload(entries))
+    before = written_bytes()
+    started = time.perf_counter()
+    for url, body in items:
+        device = cache.prepare(metadata_for(url))
+        device.write(body)
+        cache.insert(device)
+    insert_seconds = time.perf_counter() - started
+    written = written_bytes() - before
+
+    rng = random.Random(11)
+    latencies = []
+    for _ in range(lookups):
+        url, body = rng.choice(items)
+        started = time.perf_counter()
+        cache.metaData(url)
+        device = cache.data(url)
+        if device is None:
+            continue  # evicted
+        data = bytes(device.readAll())
+        latencies.append(time.perf_counter() - started)
+        assert data == body, "%s returned a corrupt body for %s" % (name, url.toString())
+
+    files, allocated = storage_usage(directory)
+    latencies.sort()
+    return {
+        "insert_seconds": round(insert_seconds, 4),
+        "hit_ratio": round(len(latencies) / float(lookups), 4) if lookups else None,
+        "hit_latency_us": {
+            "median": round(statistics.median(latencies) * 1e6, 2),
+            "p95": round(latencies[int(len(latencies) * 0.95)] * 1e6, 2),
+        } if latencies else None,
+        "bytes_written": written,
+        "allocated_bytes": allocated,
+        "files": files,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--capacity-mb", type=int, default=128)
+    parser.add_argument("--full-capacity-mb", type=int, default=8,
+                        help="capacity of the steady-state case, smaller than the workload")
+    args = parser.parse_args(argv)
+
+    app = QCoreApplication(sys.argv[:1])
+    results = {}
+    root = tempfile.mkdtemp(prefix="supernova-cache-bench-")
+    try:
+        for case, capacity in (("spare", args.capacity_mb * MB),
+                               ("full", args.full_capacity_mb * MB)):
+            directory = os.path.join(root, case, "mapped")
+            compactions = metrics.value("disk_cache_compactions")
+            cache = MappedDiskCache(os.path.join(directory, "cache.pack"), capacity)
+            mapped = run("mapped", cache, directory, args.entries, args.lookups)
+            mapped["compactions"] = metrics.value("disk_cache_compactions") - compactions
+
+            directory = os.path.join(root, case, "qt")
+            cache = QNetworkDiskCache()
+            cache.setCacheDirectory(directory)
+            cache.setMaximumCacheSize(capacity)
+            results[case] = {"capacity_bytes": capacity, "mapped": mapped,
+                             "qt": run("qt", cache, directory, args.entries, args.lookups)}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    app.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
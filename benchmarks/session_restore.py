@@ -0,0 +1,111 @@
+"""Time restoring a journaled session of many tabs offscreen.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/session_restore.py --tabs 50
+
+The journal is written the way a long-running kiosk would leave it: one
+open per tab followed by a tail of navigations, moves and activations.
+Restore must only create a view for the active tab.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.standin import StandinServer
+from config import parse_options
+from main import MainWindow
+from session import read_journal
+
+
+def write_journal(path, base_url, tabs, churn):
+    rng = random.Random(tabs)
+    events = []
+    for tab_id in range(1, tabs + 1):
+        events.append({"op": "open", "id": tab_id, "index": tab_id - 1,
+                       "url": "%s/?tab=%d" % (base_url, tab_id), "title": "Tab %d" % tab_id})
+    for step in range(churn):
+        tab_id = rng.randint(1, tabs)
+        choice = rng.random()
+        if choice < 0.6:
+            events.append({"op": "navigate", "id": tab_id, "title": "Tab %d.%d" % (tab_id, step),
+                           "url": "%s/?tab=%d&step=%d" % (base_url, tab_id, step)})
+        elif choice < 0.8:
+            events.append({"op": "move", "from": rng.randrange(tabs), "to": rng.randrange(tabs)})
+        else:
+            events.append({"op": "scroll", "id": tab_id, "x": 0, "y": rng.randint(0, 4000)})
+            events.append({"op": "activate", "id": tab_id})
+    with open(path, "w", encoding="utf-8") as journal:
+        for event in events:
+            journal.write(json.dumps(event) + "\n")
+    return len(events)
+
+
+def wait_for_load(view, timeout_ms=10000):
+    loop = QEventLoop()
+    view.loadFinished.connect(loop.quit)
+    QTimer.singleShot(timeout_ms, loop.quit)
+    loop.exec_()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tabs", type=int, default=50)
+    parser.add_argument("--churn", type=int, default=400,
+                        help="journal events written after the initial opens")
+    args = parser.parse_args(argv)
+
+    server = StandinServer().start()
+    app = QApplication(sys.argv[:1])
+    root = tempfile.mkdtemp(prefix="supernova-session-bench-")
+    try:
+        path = os.path.join(root, "session.journal")
+        events = write_journal(path, server.url, args.tabs, args.churn)
+
+        started = time.perf_counter()
+        state = read_journal(path)
+        replayed = time.perf_counter()
+
+        options = parse_options(["--config", os.devnull, "--home-url", server.url,
+                                 "--session", path, "--view-pool-size", "0"])
+        window = MainWindow(options=options)
+        restored = time.perf_counter()
+        wait_for_load(window.current_browser())
+        loaded = time.perf_counter()
+
+        records = [window.tab_registry.record_at(index) for index in range(window.tabs.count())]
+        views = sum(1 for record in records if record.view is not None)
+        with open(path, encoding="utf-8") as journal:
+            compacted_lines = sum(1 for _ in journal)
+
+        result = {
+            "tabs": window.tabs.count(),
+            "journal_events": events,
+            "replay_ms": (replayed - started) * 1000,
+            "restore_ms": (restored - replayed) * 1000,
+            "active_loaded_ms": (loaded - replayed) * 1000,
+            "views_created": views,
+            "journal_lines_after_compaction": compacted_lines,
+            "passed": window.tabs.count() == len(state.tabs) == args.tabs and views == 1,
+        }
+        print(json.dumps(result, indent=2))
+        window.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        server.stop()
+    app.quit()
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
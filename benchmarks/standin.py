@@ -0,0 +1,223 @@
+"""Local stand-ins for the kiosk backend and the on-screen keyboard."""
+
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PyQt5.QtNetwork import QLocalServer
+
+
+DASHBOARD = b"""<!DOCTYPE html>
+<html><head><title>Stand-in Dashboard</title></head>
+<body><h1>Dashboard</h1><div id="status">ok</div></body></html>
+"""
+
+
+def synthetic_dashboards(rows=400, assets=40):
+    """Pages for the benchmark suite: /small, /dom-heavy and /asset-heavy.
+
+    The DOM-heavy page is a large status table; the asset-heavy page pulls
+    in many stylesheets, scripts and images from /assets/.
+    """
+    cells = "".join("<tr>%s</tr>" % "".join("<td class=c%d>%d.%d</td>" % (col, row, col)
+                                            for col in range(10))
+                    for row in range(rows))
+    dom_heavy = ("<!DOCTYPE html><html><head><title>DOM-heavy Dashboard</title></head><body>"
+                 "<table>%s</table></body></html>" % cells).encode()
+
+    pages = {
+        "/": ("text/html", DASHBOARD),
+        "/small": ("text/html", DASHBOARD),
+        "/dom-heavy": ("text/html", dom_heavy),
+    }
+    links = []
+    for number in range(assets):
+        kind = number % 3
+        if kind == 0:
+            pages["/assets/%d.css" % number] = (
+                "text/css", (".a%d { color: #%06x; }\n" % (number, number * 997) * 200).encode())
+            links.append('<link rel="stylesheet" href="/assets/%d.css">' % number)
+        elif kind == 1:
+            pages["/assets/%d.js" % number] = (
+                "application/javascript",
+                ("var a%d = [];\n" % number + "a%d.push(%d);\n" % (number, number) * 200).encode())
+            links.append('<script src="/assets/%d.js"></script>' % number)
+        else:
+            pages["/assets/%d.svg" % number] = (
+                "image/svg+xml",
+                ('<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">'
+                 '<circle cx="32" cy="32" r="%d"/></svg>' % (8 + number % 24)).encode())
+            links.append('<img src="/assets/%d.svg">' % number)
+    pages["/asset-heavy"] = ("text/html", (
+        "<!DOCTYPE html><html><head><title>Asset-heavy Dashboard</title></head><body>"
+        "%s<div id=status>ok</div></body></html>" % "".join(links)).encode())
+    return pages
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        hit = self.server.enter(self.path)
+        try:
+            self.respond(hit)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on this request
+        finally:
+            self.server.leave()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def respond(self, hit):
+        address = urlsplit(self.path)
+        query = parse_qs(address.query)
+        page = self.server.pages.get(address.path)
+        delay = float(query.get("delay", [self.server.delay])[0])
+        if delay and hit < int(query.get("delayed", [hit + 1])[0]):
+            time.sleep(delay)
+        if hit < int(query.get("fail", [0])[0]):
+            self.send_error(503)
+            return
+        if "redirect" in query:
+            self.send_response(302)
+            self.send_header("Location", query["redirect"][0])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if page is None:
+            self.send_error(404)
+            return
+        content_type, body = page
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        stall = float(query.get("stall", [0])[0])
+        if stall:
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            time.sleep(stall)
+            body = body[len(body) // 2:]
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200 if self.path.split("?")[0] in self.server.pages else 404)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, pages, delay):
+        super(StandinHTTPServer, self).__init__(("127.0.0.1", 0), StandinHandler)
+        self.pages = pages
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.hits = collections.Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def enter(self, path):
+        with self.lock:
+            hit = self.hits[path]
+            self.hits[path] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return hit
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+class StandinServer(object):
+    """Serves canned pages on an ephemeral loopback port from a daemon thread.
+
+    pages maps a path to a (content type, body bytes) tuple; delay adds a
+    fixed latency to every GET. Query parameters misbehave on purpose, per
+    request path and query:
+
+        ?delay=SECONDS   wait this long before the headers instead
+        ?delayed=N       only delay the first N requests
+        ?fail=N          answer the first N requests with 503
+        ?redirect=URL    answer with a 302 to URL
+        ?stall=SECONDS   send half the body, then stall this long
+
+    hits counts the requests seen per path and query, and peak_in_flight
+    the most requests that were being served at once.
+    """
+
+    def __init__(self, pages=None, delay=0.0):
+        self.httpd = StandinHTTPServer(pages or {"/": ("text/html", DASHBOARD)}, delay)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def hits(self):
+        return self.httpd.hits
+
+    @property
+    def peak_in_flight(self):
+        return self.httpd.peak_in_flight
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StandinKeyboard(object):
+    """Answers the keyboard control line protocol on a QLocalServer.
+
+    Every "show" or "hide" line is recorded in commands and answered with
+    "ok", or "error" for anything else. With silent set, commands are
+    recorded but never answered. Runs on the Qt event loop of the caller.
+    """
+
+    def __init__(self, name, silent=False):
+        self.name = name
+        self.silent = silent
+        self.commands = []
+        self.clients = []
+        self.server = QLocalServer()
+        self.server.newConnection.connect(self.accept)
+
+    def start(self):
+        QLocalServer.removeServer(self.name)
+        if not self.server.listen(self.name):
+            raise OSError(self.server.errorString())
+        return self
+
+    def stop(self):
+        self.server.close()
+        for client in self.clients:
+            client.disconnectFromServer()
+        self.clients = []
+
+    @property
+    def visible(self):
+        return bool(self.commands) and self.commands[-1] == "show"
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            client = self.server.nextPendingConnection()
+            client.readyRead.connect(lambda client=client: self.read(client))
+            self.clients.append(client)
+
+    def read(self, client):
+        while client.canReadLine():
+            command = bytes(client.readLine()).decode().strip()
+            self.commands.append(command)
+            if not self.silent:
+                client.write(b"ok\n" if command in ("show", "hide") else b"error\n")
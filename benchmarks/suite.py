@@ -0,0 +1,200 @@
+"""Measure startup, tab open, navigation and tab switch latency offscreen.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --output results.json
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --compare results.json
+
+Every synthetic dashboard from benchmarks/standin.py (small, DOM-heavy
+and asset-heavy) gets a fresh MainWindow with the ephemeral cache profile
+and its own cache directory, so no window starts from another's disk
+cache, home snapshot or session. Latencies are in milliseconds;
+the summary of each metric is its median and p95 over --repeat samples.
+With --compare the run is checked against a stored result and exits
+non-zero when a median got slower by more than --tolerance.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QEvent, QEventLoop, QTimer, QUrl
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.standin import StandinServer, synthetic_dashboards
+from config import parse_options
+from main import MainWindow
+from memory import resident_set_size
+from startup import StartupTrace
+
+
+PAGES = ("small", "dom-heavy", "asset-heavy")
+TIMEOUT_MS = 15000
+
+
+def wait_for_load(view, timeout_ms=TIMEOUT_MS):
+    loop = QEventLoop()
+    view.loadFinished.connect(loop.quit)
+    QTimer.singleShot(timeout_ms, loop.quit)
+    loop.exec_()
+    view.loadFinished.disconnect(loop.quit)
+
+
+def wait_until(condition, timeout_ms=TIMEOUT_MS):
+    deadline = time.perf_counter() + timeout_ms / 1000.0
+    while not condition() and time.perf_counter() < deadline:
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+
+
+def flush_deletes():
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QCoreApplication.processEvents()
+    gc.collect()
+
+
+def elapsed_ms(started):
+    return (time.perf_counter() - started) * 1000.0
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "samples": len(ordered),
+    }
+
+
+def open_window(base_url, page, root):
+    # The disk cache and home snapshot live under XDG_CACHE_HOME
+    directory = tempfile.mkdtemp(dir=root)
+    os.environ["XDG_CACHE_HOME"] = directory
+    options = parse_options(["--config", os.devnull, "--home-url", "%s/%s" % (base_url, page),
+                             "--cache-profile", "ephemeral",
+                             "--session", os.path.join(directory, "session.journal"),
+                             "--no-session-restore", "--idle-timeout", "0",
+                             "--stall-threshold", "0"])
+    trace = StartupTrace()
+    window = MainWindow(options=options, startup_trace=trace)
+    wait_until(lambda: trace.seen("first_paint") and trace.seen("home_load_finished"))
+    phases = dict(trace.phases)
+    return window, phases.get("first_paint"), phases.get("home_load_finished")
+
+
+def run_page(base_url, page, repeat, root):
+    results = {"first_paint_ms": [], "home_load_ms": []}
+    for _ in range(repeat):
+        window, first_paint, home_load = open_window(base_url, page, root)
+        if first_paint is not None:
+            results["first_paint_ms"].append(first_paint)
+        if home_load is not None:
+            results["home_load_ms"].append(home_load)
+        window.close()
+        window.deleteLater()
+        flush_deletes()
+
+    window, _, _ = open_window(base_url, page, root)
+    url = "%s/%s" % (base_url, page)
+
+    samples = []
+    rss_before = resident_set_size()
+    for number in range(repeat):
+        started = time.perf_counter()
+        record = window.add_new_tab(QUrl("%s?tab=%d" % (url, number)))
+        wait_for_load(record.view)
+        samples.append(elapsed_ms(started))
+    flush_deletes()
+    results["add_new_tab_ms"] = samples
+    results["rss_per_tab_bytes"] = [(resident_set_size() - rss_before) / float(repeat)]
+
+    samples = []
+    for number in range(repeat):
+        window.url_bar.setText("%s?navigate=%d" % (url, number))
+        view = window.current_browser()
+        started = time.perf_counter()
+        window.navigate_to_url()
+        wait_for_load(view)
+        samples.append(elapsed_ms(started))
+    results["navigate_ms"] = samples
+
+    for name, switch in (("next_tab_ms", window.next_tab), ("previous_tab_ms", window.previous_tab)):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            switch()
+            window.current_browser().repaint()
+            samples.append(elapsed_ms(started))
+        results[name] = samples
+
+    window.close()
+    window.deleteLater()
+    flush_deletes()
+    return {name: summary(values) for name, values in results.items() if values}
+
+
+def compare(results, baseline, tolerance):
+    """Return (page, metric, baseline, current) for every slower median."""
+    regressions = []
+    for page, metrics in results["pages"].items():
+        for name, current in metrics.items():
+            previous = baseline.get("pages", {}).get(page, {}).get(name)
+            if previous and current["median"] > previous["median"] * (1.0 + tolerance):
+                regressions.append((page, name, previous["median"], current["median"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=list(PAGES))
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds of server latency added to every GET")
+    parser.add_argument("--output", metavar="PATH", help="write results as JSON to PATH")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="flag medians slower than this earlier result")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown over the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    server = StandinServer(synthetic_dashboards(), delay=args.delay).start()
+    app = QApplication(sys.argv[:1])
+    root = tempfile.mkdtemp(prefix="supernova-suite-")
+    try:
+        results = {
+            "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                            "repeat": args.repeat, "delay": args.delay},
+            "pages": {page: run_page(server.url, page, args.repeat, root) for page in args.pages},
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        server.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as destination:
+            destination.write(output + "\n")
+    else:
+        print(output)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as source:
+            regressions = compare(results, json.load(source), args.tolerance)
+        for page, name, previous, current in regressions:
+            print("REGRESSION %s %s: %.2f -> %.2f (%+.0f%%)"
+                  % (page, name, previous, current, (current / previous - 1.0) * 100.0))
+        status = 1 if regressions else 0
+    app.quit()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
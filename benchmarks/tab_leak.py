@@ -0,0 +1,88 @@
+"""Open and close many tabs offscreen and check that RSS returns to baseline.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/tab_leak.py --tabs 1000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QEvent, QEventLoop, QTimer, QUrl
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.standin import StandinServer
+from config import parse_options
+from main import MainWindow
+from memory import MB, resident_set_size
+from tabs import LOADED
+
+
+def wait_for_load(view, timeout_ms=5000):
+    loop = QEventLoop()
+    view.loadFinished.connect(loop.quit)
+    QTimer.singleShot(timeout_ms, loop.quit)
+    loop.exec_()
+
+
+def flush_deletes():
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    QCoreApplication.processEvents()
+    gc.collect()
+
+
+def cycle_tabs(window, url, count):
+    for _ in range(count):
+        record = window.add_new_tab(url)
+        if record.load_state != LOADED:
+            wait_for_load(record.view)
+        window.close_tab(window.tabs.currentIndex())
+        flush_deletes()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tabs", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--bound-mb", type=int, default=64,
+                        help="allowed RSS growth over the post-warmup baseline")
+    args = parser.parse_args(argv)
+
+    server = StandinServer().start()
+    app = QApplication(sys.argv[:1])
+    session = os.path.join(tempfile.mkdtemp(prefix="supernova-tab-leak-"), "session.journal")
+    options = parse_options(["--config", os.devnull, "--home-url", server.url,
+                             "--session", session, "--no-session-restore",
+                             "--tab-memory-budget", "0", "--view-pool-size", "0"])
+    window = MainWindow(options=options)
+    url = QUrl(server.url)
+
+    cycle_tabs(window, url, args.warmup)
+    baseline = resident_set_size()
+    cycle_tabs(window, url, args.tabs)
+    final = resident_set_size()
+
+    growth = final - baseline
+    result = {
+        "tabs": args.tabs,
+        "baseline_rss": baseline,
+        "final_rss": final,
+        "growth_bytes": growth,
+        "bound_bytes": args.bound_mb * MB,
+        "passed": growth <= args.bound_mb * MB,
+    }
+    print(json.dumps(result, indent=2))
+
+    window.close()
+    server.stop()
+    app.quit()
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
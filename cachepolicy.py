@@ -0,0 +1,107 @@
+from collections import namedtuple
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWebKit import QWebSettings
+
+from memory import MB, resident_set_size
+from network import set_disk_cache_size
+
+
+CacheProfile = namedtuple("CacheProfile", [
+    "name",
+    "object_cache",         # (min dead, max dead, total) capacities in bytes
+    "pages_in_cache",       # back/forward page cache entries
+    "history_items",        # per-tab QWebHistory length
+    "offline_storage_quota",
+    "app_cache_quota",
+    "disk_cache_size",      # 0 disables the shared disk cache
+    "private_browsing",
+    "memory_ceiling",       # RSS in bytes above which memory caches are purged
+])
+
+PROFILES = {
+    "ephemeral": CacheProfile(
+        name="ephemeral",
+        object_cache=(0, 0, 0),
+        pages_in_cache=0,
+        history_items=0,
+        offline_storage_quota=0,
+        app_cache_quota=0,
+        disk_cache_size=0,
+        private_browsing=True,
+        memory_ceiling=256 * MB,
+    ),
+    "low-memory": CacheProfile(
+        name="low-memory",
+        object_cache=(0, 2 * MB, 8 * MB),
+        pages_in_cache=1,
+        history_items=20,
+        offline_storage_quota=1 * MB,
+        app_cache_quota=2 * MB,
+        disk_cache_size=20 * MB,
+        private_browsing=False,
+        memory_ceiling=384 * MB,
+    ),
+    "performance": CacheProfile(
+        name="performance",
+        object_cache=(8 * MB, 32 * MB, 96 * MB),
+        pages_in_cache=5,
+        history_items=100,
+        offline_storage_quota=16 * MB,
+        app_cache_quota=32 * MB,
+        disk_cache_size=200 * MB,
+        private_browsing=False,
+        memory_ceiling=1024 * MB,
+    ),
+}
+
+DEFAULT_PROFILE = "low-memory"
+
+
+class CachePolicy(object):
+    """Applies a cache profile to WebKit and the shared network stack.
+
+    Besides setting capacities up front, a guard timer samples RSS and purges
+    WebKit's memory caches whenever the profile's ceiling is crossed.
+    """
+
+    GUARD_INTERVAL_MS = 5000
+
+    def __init__(self, profile, memory_ceiling=None, disk_cache_backend="mapped"):
+        if memory_ceiling:
+            profile = profile._replace(memory_ceiling=memory_ceiling)
+        self.profile = profile
+        self.disk_cache_backend = disk_cache_backend
+        self.purges = 0
+        self.guard = None
+
+    def apply(self):
+        profile = self.profile
+        settings = QWebSettings.globalSettings()
+
+        QWebSettings.setObjectCacheCapacities(*profile.object_cache)
+        QWebSettings.setMaximumPagesInCache(profile.pages_in_cache)
+        QWebSettings.setOfflineStorageDefaultQuota(profile.offline_storage_quota)
+        QWebSettings.setOfflineWebApplicationCacheQuota(profile.app_cache_quota)
+
+        settings.setAttribute(QWebSettings.OfflineStorageDatabaseEnabled,
+                              profile.offline_storage_quota > 0)
+        settings.setAttribute(QWebSettings.OfflineWebApplicationCacheEnabled,
+                              profile.app_cache_quota > 0)
+        settings.setAttribute(QWebSettings.LocalStorageEnabled,
+                              profile.offline_storage_quota > 0)
+        settings.setAttribute(QWebSettings.PrivateBrowsingEnabled, profile.private_browsing)
+
+        set_disk_cache_size(profile.disk_cache_size, self.disk_cache_backend)
+
+    def configure_page(self, page):
+        page.history().setMaximumItemCount(self.profile.history_items)
+
+    def start_memory_guard(self, parent):
+        self.guard = QTimer(parent)
+        self.guard.timeout.connect(self.check_memory)
+        self.guard.start(self.GUARD_INTERVAL_MS)
+
+    def check_memory(self):
+        if resident_set_size() > self.profile.memory_ceiling:
+            QWebSettings.clearMemoryCaches()
+            self.purges += 1
@@ -0,0 +1,192 @@
+import fnmatch
+import time
+from PyQt5.QtCore import QTimer, QUrl
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from metrics import metrics
+from network import network_manager
+from networkreply import ProxyReply, reply_metadata
+
+
+# Requests whose response depends on more than the URL are never shared,
+# and neither are requests carrying any header not listed as shareable
+PRIVATE_HEADERS = (b"If-None-Match", b"If-Modified-Since", b"Range", b"Authorization")
+SHAREABLE_HEADERS = frozenset((b"accept", b"accept-language", b"accept-encoding", b"origin",
+                               b"referer", b"user-agent", b"cache-control", b"pragma"))
+
+
+def parse_micro_cache_rules(rules):
+    """Build (glob, ttl seconds) micro-cache rules from (pattern, [ttl]) pairs."""
+    return [(pattern, float(values[0])) for pattern, values in rules]
+
+
+class Flight(object):
+    """One upstream GET and every page reply waiting on it."""
+
+    __slots__ = ("key", "upstream", "waiters", "metadata", "chunks", "size", "joinable")
+
+    def __init__(self, key, upstream):
+        self.key = key
+        self.upstream = upstream
+        self.waiters = []
+        self.metadata = None
+        self.chunks = []
+        self.size = 0
+        self.joinable = True
+
+
+class Coalescer(object):
+    """Request handler merging identical concurrent GETs into one upstream request.
+
+    A GET that matches one already in flight gets a reply fed from the same
+    upstream response, including whatever arrived before it joined. For URLs
+    with a micro-cache rule, completed responses are also reused for a
+    short TTL, so polling from many tabs costs one backend hit per TTL.
+    Requests are only shared with the same Accept and Origin headers.
+    Conditional, ranged, authorized and forced-network GETs, and any GET
+    with a custom header such as an API key, always go upstream on their
+    own.
+    """
+
+    MAX_BUFFERED = 1024 * 1024
+    MAX_MICRO_ENTRIES = 256
+
+    def __init__(self, micro_rules=()):
+        self.micro_rules = micro_rules
+        self.flights = {}
+        self.micro_cache = {}
+
+    @staticmethod
+    def key(request):
+        return (request.url().toString(QUrl.RemoveFragment), bytes(request.rawHeader(b"Accept")),
+                bytes(request.rawHeader(b"Origin")))
+
+    @staticmethod
+    def shareable(request):
+        if any(request.hasRawHeader(name) for name in PRIVATE_HEADERS):
+            return False
+        if any(bytes(name).lower() not in SHAREABLE_HEADERS for name in request.rawHeaderList()):
+            return False
+        return (request.attribute(QNetworkRequest.CacheLoadControlAttribute)
+                != QNetworkRequest.AlwaysNetwork)
+
+    def micro_ttl(self, url):
+        address = url.toString(QUrl.RemoveQuery | QUrl.RemoveFragment)
+        for pattern, ttl in self.micro_rules:
+            if fnmatch.fnmatchcase(address, pattern):
+                return ttl
+        return 0
+
+    def handle(self, operation, request, data, forward):
+        if (operation != QNetworkAccessManager.GetOperation or data is not None
+                or request.url().scheme() not in ("http", "https")
+                or not self.shareable(request)):
+            return forward(operation, request, data)
+
+        key = self.key(request)
+        cached = self.micro_cache.get(key)
+        if cached is not None:
+            expires, status, reason, headers, body = cached
+            if time.monotonic() < expires:
+                metrics.inc("net_micro_cache_hits")
+                reply = ProxyReply(operation, request, network_manager())
+                reply.serve(status, reason, headers, body)
+                return reply
+            del self.micro_cache[key]
+
+        reply = ProxyReply(operation, request, network_manager())
+        flight = self.flights.get(key)
+        if flight is not None and flight.joinable:
+            metrics.inc("net_coalesced_requests")
+            self.join(flight, reply)
+            return reply
+
+        metrics.inc("net_upstream_gets")
+        flight = Flight(key, forward(operation, request, data))
+        self.flights[key] = flight
+        flight.waiters.append(reply)
+        reply.canceled.connect(lambda: self.leave(flight, reply))
+
+        upstream = flight.upstream
+        upstream.metaDataChanged.connect(lambda: self.metadata(flight))
+        upstream.readyRead.connect(lambda: self.ready_read(flight))
+        upstream.finished.connect(lambda: self.finished(flight))
+        return reply
+
+    def join(self, flight, reply):
+        # Replay what already arrived; signals wait until the page has connected
+        reply.hold()
+        if flight.metadata is not None:
+            reply.set_metadata(*flight.metadata)
+        for chunk in flight.chunks:
+            reply.append(chunk)
+        flight.waiters.append(reply)
+        reply.canceled.connect(lambda: self.leave(flight, reply))
+        QTimer.singleShot(0, reply.release)
+
+    def leave(self, flight, reply):
+        if reply in flight.waiters:
+            flight.waiters.remove(reply)
+        if not flight.waiters and flight.upstream is not None:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+            upstream, flight.upstream = flight.upstream, None
+            upstream.abort()
+            upstream.deleteLater()
+
+    def metadata(self, flight):
+        if flight.upstream is None:
+            return
+        flight.metadata = reply_metadata(flight.upstream)
+        for reply in flight.waiters:
+            reply.set_metadata(*flight.metadata)
+
+    def ready_read(self, flight):
+        if flight.upstream is None:
+            return
+        chunk = bytes(flight.upstream.readAll())
+        if not chunk:
+            return
+        if flight.joinable:
+            flight.chunks.append(chunk)
+            flight.size += len(chunk)
+            if flight.size > self.MAX_BUFFERED:
+                # Too large to replay to latecomers
+                flight.joinable = False
+                flight.chunks = []
+        for reply in flight.waiters:
+            reply.append(chunk)
+
+    def finished(self, flight):
+        upstream = flight.upstream
+        if upstream is None:
+            return
+        self.ready_read(flight)
+        flight.upstream = None
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+        error, message = upstream.error(), upstream.errorString()
+        if flight.metadata is None:
+            flight.metadata = reply_metadata(upstream)
+        for reply in flight.waiters:
+            reply.finish(error, message)
+        flight.waiters = []
+        self.remember(flight, error)
+        upstream.deleteLater()
+
+    def remember(self, flight, error):
+        status, reason, headers = flight.metadata
+        if error != QNetworkReply.NoError or status != 200 or not flight.joinable:
+            return
+        ttl = self.micro_ttl(QUrl(flight.key[0]))
+        if not ttl:
+            return
+        if len(self.micro_cache) >= self.MAX_MICRO_ENTRIES:
+            now = time.monotonic()
+            for key in [key for key, entry in self.micro_cache.items() if entry[0] <= now]:
+                del self.micro_cache[key]
+            if len(self.micro_cache) >= self.MAX_MICRO_ENTRIES:
+                return
+        self.micro_cache[flight.key] = (time.monotonic() + ttl, status, reason, headers,
+                                        b"".join(flight.chunks))
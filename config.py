@@ -0,0 +1,141 @@
+import argparse
+import configparser
+import os
+import re
+
+from cachepolicy import DEFAULT_PROFILE, PROFILES
+from network import DISK_CACHE_BACKENDS
+from session import DEFAULT_SESSION_PATH
+from throttle import THROTTLE_MODES
+
+
+CONFIG_SECTION = "supernova"
+DEFAULT_SWR_POLICIES = ("*.js 0 86400; *.css 0 86400; *.woff2 0 604800; "
+                        "*.png 60 86400; *.svg 60 86400")
+DEFAULT_ASSET_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets.pack")
+DEFAULT_CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".config", "supernova-surfer.ini")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="supernova-surfer")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH,
+                        help="INI file whose [supernova] keys provide option defaults")
+    parser.add_argument("--fullscreen", action="store_true")
+    parser.add_argument("--home-url", default="http://127.0.0.1:8005")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="show the window and start the home load before building the navbar")
+    parser.add_argument("--startup-trace", metavar="PATH",
+                        help="write startup phase timestamps to PATH as JSON")
+    parser.add_argument("--session", default=DEFAULT_SESSION_PATH, metavar="PATH",
+                        help="journal of open tabs, replayed on the next start")
+    parser.add_argument("--no-session-restore", action="store_true",
+                        help="start with the home tab instead of the journaled tabs")
+    parser.add_argument("--cache-profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument("--memory-ceiling", type=int, default=0, metavar="MB",
+                        help="override the cache profile's memory ceiling")
+    parser.add_argument("--disk-cache-backend", choices=DISK_CACHE_BACKENDS, default="mapped",
+                        help="single memory-mapped pack file, or Qt's file-per-entry cache")
+    parser.add_argument("--tab-memory-budget", type=int, default=600, metavar="MB",
+                        help="discard background tabs while RSS is above this (0 disables)")
+    parser.add_argument("--max-concurrent-loads", type=int, default=2,
+                        help="background tab loads allowed to run at the same time")
+    parser.add_argument("--view-pool-size", type=int, default=1,
+                        help="number of pre-loaded home page views kept for new tabs")
+    parser.add_argument("--idle-timeout", type=int, default=300, metavar="SECONDS",
+                        help="suspend pages after this long without input (0 disables)")
+    parser.add_argument("--idle-fps", type=float, default=1.0,
+                        help="timer and repaint rate of the visible page while idle")
+    parser.add_argument("--idle-screenshot", action="store_true",
+                        help="pause the visible page too while idle and show a still of it")
+    parser.add_argument("--background-throttle", choices=THROTTLE_MODES, default="clamp",
+                        help="how tabs behind the current one are throttled")
+    parser.add_argument("--background-throttle-period", type=int, default=1000, metavar="MS",
+                        help="minimum timer period of background tabs in clamp mode")
+    parser.add_argument("--background-throttle-rules", default="", metavar="RULES",
+                        help='"URL-GLOB MODE" rules separated by ";"; mode none allowlists '
+                             'tabs that must keep running in the background')
+    parser.add_argument("--record-archive", metavar="PATH",
+                        help="record every HTTP response pages receive into a network archive")
+    parser.add_argument("--replay-archive", metavar="PATH",
+                        help="serve HTTP requests only from a recorded network archive")
+    parser.add_argument("--replay-latency", action="store_true",
+                        help="replay the recorded response times as well")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write page loads, requests and UI events to PATH in Chrome "
+                             "trace-event format (open in Perfetto or chrome://tracing)")
+    parser.add_argument("--metrics-port", type=int, default=0, metavar="PORT",
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 disables)")
+    parser.add_argument("--stall-threshold", type=float, default=5.0, metavar="SECONDS",
+                        help="log all thread stacks when the GUI thread is blocked this long "
+                             "(0 disables the watchdog)")
+    parser.add_argument("--stall-log", metavar="PATH",
+                        help="rotating log for stall reports (default: next to the cache)")
+    parser.add_argument("--keyboard-control", default="dbus", metavar="dbus|socket:NAME|none",
+                        help="channel used to show and hide the resident onboard keyboard")
+    parser.add_argument("--emode-script", default="emodeui.js",
+                        help="page script injected into every tab and triggered by Escape")
+    parser.add_argument("--asset-pack", default=DEFAULT_ASSET_PACK, metavar="PATH",
+                        help="pack served under supernova://assets/ (see assetpack.py build)")
+    parser.add_argument("--swr-cache-size", type=int, default=32, metavar="MB",
+                        help="memory for the stale-while-revalidate cache (0 disables it)")
+    parser.add_argument("--swr-policies", default=DEFAULT_SWR_POLICIES, metavar="RULES",
+                        help='"URL-GLOB MAX-AGE STALE" rules in seconds, separated by ";"')
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="send identical concurrent GETs upstream separately")
+    parser.add_argument("--micro-cache", default="", metavar="RULES",
+                        help='"URL-GLOB TTL" rules in seconds, separated by ";", for polled '
+                             'endpoints whose responses may be shared between tabs')
+    parser.add_argument("--connect-timeout", type=int, default=5000, metavar="MS",
+                        help="fail or retry a GET or HEAD with no response headers after this")
+    parser.add_argument("--long-poll", default="", metavar="GLOBS",
+                        help='URL globs separated by ";" for long-poll or streaming endpoints, '
+                             'which are never timed out waiting for headers or hedged')
+    parser.add_argument("--read-timeout", type=int, default=15000, metavar="MS",
+                        help="fail a response whose body stalls for this long")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="retries for idempotent requests that time out or fail transiently")
+    parser.add_argument("--hedge-percentile", type=int, default=95,
+                        help="duplicate a GET once it is slower than this latency percentile "
+                             "of its host (0 disables hedging)")
+    parser.add_argument("--host-concurrency", type=int, default=6,
+                        help="requests per host handed to the network stack at once")
+    return parser
+
+
+def read_config_file(parser, path):
+    config = configparser.ConfigParser()
+    if not config.read(path) or not config.has_section(CONFIG_SECTION):
+        return {}
+
+    flags = {action.dest for action in parser._actions
+             if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction))}
+    defaults = {}
+    for key in config[CONFIG_SECTION]:
+        dest = key.replace("-", "_")
+        if dest in flags:
+            defaults[dest] = config[CONFIG_SECTION].getboolean(key)
+        else:
+            defaults[dest] = config[CONFIG_SECTION][key]
+    return defaults
+
+
+def parse_options(argv=()):
+    """Parse command line options, falling back to the config file's values.
+
+    Unknown arguments are ignored so Qt's own flags can share sys.argv.
+    """
+    parser = build_parser()
+    early, _ = parser.parse_known_args(argv)
+    parser.set_defaults(**read_config_file(parser, early.config))
+    options, _ = parser.parse_known_args(argv)
+    return options
+
+
+def parse_url_rules(text):
+    """Split "URL-GLOB VALUE..." rules separated by semicolons or newlines."""
+    rules = []
+    for line in re.split(r"[;\n]", text or ""):
+        fields = line.split()
+        if fields:
+            rules.append((fields[0], fields[1:]))
+    return rules
@@ -0,0 +1,154 @@
+import time
+
+from PyQt5.QtCore import QEvent, QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+from metrics import metrics
+from suspend import PAUSED, page_state, set_page_throttle
+
+
+INPUT_EVENTS = frozenset((
+    QEvent.MouseMove, QEvent.MouseButtonPress, QEvent.Wheel, QEvent.KeyPress,
+    QEvent.TouchBegin, QEvent.TouchUpdate, QEvent.TabletPress,
+))
+
+
+class FrameLimiter(QObject):
+    """Lets a widget repaint at most once every period ms."""
+
+    def __init__(self, widget, period, parent=None):
+        super(FrameLimiter, self).__init__(parent)
+        self.widget = widget
+        self.allowed = False
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(period)
+        widget.installEventFilter(self)
+
+    def tick(self):
+        self.allowed = True
+        self.widget.update()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            if not self.allowed:
+                metrics.inc("idle_paints_skipped")
+                return True
+            self.allowed = False
+        return False
+
+    def stop(self):
+        self.timer.stop()
+        self.widget.removeEventFilter(self)
+        self.widget.update()
+
+
+class IdleController(QObject):
+    """Suspends the kiosk's pages after a period without input.
+
+    Background tabs are paused, the visible page's timers and repaints are
+    limited to idle_fps, and with screenshot the visible page is paused too
+    and replaced by a still of itself. Any input resumes everything before
+    the event is delivered.
+
+    CPU time saved is estimated against the process CPU rate measured while
+    the kiosk was last active, and reported as idle_cpu_seconds_saved.
+    idle_changed is emitted after suspending and after resuming, so other
+    page policies can reassert themselves on views created meanwhile.
+    """
+
+    CHECK_INTERVAL_MS = 1000
+
+    idle_changed = pyqtSignal(bool)
+
+    def __init__(self, registry, timeout, idle_fps=1, screenshot=False, parent=None):
+        super(IdleController, self).__init__(parent)
+        self.registry = registry
+        self.timeout = timeout
+        self.frame_period = int(1000 / max(idle_fps, 0.1))
+        self.screenshot = screenshot
+        self.idle = False
+        self.limiter = None
+        self.frozen = None
+        self.saved = []
+        self.last_input = time.monotonic()
+        self.active_sample = (self.last_input, time.process_time())
+        self.active_rate = 0.0
+        self.idle_since = None
+
+        self.check_timer = QTimer(self)
+        self.check_timer.timeout.connect(self.check)
+        if timeout > 0:
+            QApplication.instance().installEventFilter(self)
+            self.check_timer.start(self.CHECK_INTERVAL_MS)
+
+    def eventFilter(self, obj, event):
+        if event.type() in INPUT_EVENTS:
+            self.last_input = time.monotonic()
+            if self.idle:
+                self.resume()
+        return False
+
+    def check(self):
+        now = time.monotonic()
+        if self.idle:
+            return
+        sampled_at, cpu = self.active_sample
+        if now > sampled_at:
+            cpu_now = time.process_time()
+            rate = (cpu_now - cpu) / (now - sampled_at)
+            self.active_rate = rate if not self.active_rate else 0.8 * self.active_rate + 0.2 * rate
+            self.active_sample = (now, cpu_now)
+        if now - self.last_input >= self.timeout:
+            self.suspend()
+
+    def suspend(self):
+        self.idle = True
+        self.idle_since = (time.monotonic(), time.process_time())
+        current = self.registry.current_record()
+        self.saved = [(record, record.view, page_state(record.view.page()))
+                      for record in self.registry.views.values()]
+        for record, _, _ in self.saved:
+            if record is not current:
+                set_page_throttle(record.view.page(), PAUSED)
+
+        if current is not None and current.view is not None:
+            view = current.view
+            if self.screenshot:
+                still = view.grab()
+                set_page_throttle(view.page(), PAUSED)
+                view.hide()
+                current.host.show_placeholder(still)
+                self.frozen = current
+            else:
+                set_page_throttle(view.page(), self.frame_period)
+                self.limiter = FrameLimiter(view, self.frame_period, self)
+
+        metrics.inc("idle_periods")
+        metrics.set("idle", 1)
+        self.idle_changed.emit(True)
+
+    def resume(self):
+        self.idle = False
+        if self.limiter is not None:
+            self.limiter.stop()
+            self.limiter.deleteLater()
+            self.limiter = None
+        if self.frozen is not None:
+            self.frozen.host.clear_placeholder()
+            if self.frozen.view is not None:
+                self.frozen.view.show()
+            self.frozen = None
+        for record, view, state in self.saved:
+            if record.view is view:
+                set_page_throttle(view.page(), *state)
+        self.saved = []
+
+        started, cpu = self.idle_since
+        now, cpu_now = time.monotonic(), time.process_time()
+        elapsed = now - started
+        metrics.inc("idle_seconds", elapsed)
+        metrics.inc("idle_cpu_seconds_saved", max(0.0, self.active_rate * elapsed - (cpu_now - cpu)))
+        metrics.set("idle", 0)
+        self.active_sample = (now, cpu_now)
+        self.idle_changed.emit(False)
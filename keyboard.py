@@ -0,0 +1,188 @@
+import time
+from PyQt5.QtCore import QObject, QProcess, QTimer, Qt
+from PyQt5.QtNetwork import QLocalSocket
+
+try:
+    from PyQt5.QtDBus import QDBusConnection, QDBusInterface, QDBusPendingCallWatcher
+except ImportError:  # QtDBus is not built on every platform
+    QDBusConnection = None
+
+from metrics import metrics
+
+
+ONBOARD_SERVICE = "org.onboard.Onboard"
+ONBOARD_PATH = "/org/onboard/Onboard/Keyboard"
+ONBOARD_INTERFACE = "org.onboard.Onboard.Keyboard"
+
+
+class DBusChannel(object):
+    """Drives a running onboard through its D-Bus Show/Hide methods."""
+
+    def __init__(self):
+        self.bus = QDBusConnection.sessionBus()
+        self.interface = QDBusInterface(ONBOARD_SERVICE, ONBOARD_PATH, ONBOARD_INTERFACE, self.bus)
+        self.watchers = set()
+
+    def available(self):
+        if not self.bus.isConnected():
+            return False
+        reply = self.bus.interface().isServiceRegistered(ONBOARD_SERVICE)
+        return reply.isValid() and reply.value()
+
+    def send(self, command, done):
+        watcher = QDBusPendingCallWatcher(self.interface.asyncCall(command.capitalize()))
+        self.watchers.add(watcher)
+
+        def finished(call):
+            self.watchers.discard(call)
+            done(not call.isError())
+
+        watcher.finished.connect(finished)
+
+
+class LocalSocketChannel(object):
+    """Line protocol over a QLocalSocket: sends "show"/"hide", expects "ok".
+
+    Used in place of D-Bus by on-screen keyboards driven through a socket and
+    by stand-in keyboards in tests. The socket connects asynchronously;
+    commands sent meanwhile are queued, and every queued or unanswered
+    command fails once the connection is refused or lost.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.socket = QLocalSocket()
+        self.socket.connected.connect(self.flush)
+        self.socket.stateChanged.connect(self.state_changed)
+        self.socket.readyRead.connect(self.read_replies)
+        self.outbox = []
+        self.pending = []
+
+    def connect(self):
+        if self.socket.state() == QLocalSocket.UnconnectedState:
+            self.socket.connectToServer(self.name)
+
+    def available(self):
+        self.connect()
+        return self.socket.state() != QLocalSocket.UnconnectedState
+
+    def send(self, command, done):
+        self.outbox.append((command, done))
+        if self.socket.state() == QLocalSocket.ConnectedState:
+            self.flush()
+        else:
+            self.connect()
+
+    def flush(self):
+        outbox, self.outbox = self.outbox, []
+        for command, done in outbox:
+            self.pending.append(done)
+            self.socket.write((command + "\n").encode())
+
+    def state_changed(self, state):
+        if state != QLocalSocket.UnconnectedState:
+            return
+        failed = [done for _, done in self.outbox] + self.pending
+        self.outbox = []
+        self.pending = []
+        for done in failed:
+            done(False)
+
+    def read_replies(self):
+        while self.socket.canReadLine() and self.pending:
+            reply = bytes(self.socket.readLine()).strip()
+            self.pending.pop(0)(reply == b"ok")
+
+
+def default_channel(spec="dbus"):
+    if spec.startswith("socket:"):
+        return LocalSocketChannel(spec[len("socket:"):])
+    if spec == "dbus" and QDBusConnection is not None:
+        # No session bus is common on xinit and systemd kiosks
+        if QDBusConnection.sessionBus().isConnected():
+            return DBusChannel()
+    return None
+
+
+class KeyboardManager(QObject):
+    """Keeps one onboard process resident and shows or hides it on demand.
+
+    The keyboard is started once, then toggled over its control channel
+    instead of forking a new process on every focus change. Hides are
+    delayed briefly so moving focus between two text fields does not flicker.
+    """
+
+    HIDE_DELAY_MS = 250
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, program="onboard", channel=None, parent=None):
+        super(KeyboardManager, self).__init__(parent)
+        self.program = program
+        self.channel = channel
+        self.visible = False
+        self.process = QProcess(self)
+        self.process.finished.connect(self.process_finished)
+        self.process.errorOccurred.connect(self.process_error)
+
+        self.hide_timer = QTimer(self)
+        self.hide_timer.setSingleShot(True)
+        self.hide_timer.timeout.connect(lambda: self.send("hide"))
+
+    def ensure_running(self):
+        if self.process.state() != QProcess.NotRunning:
+            return True
+        if self.channel is not None and self.channel.available():
+            return True  # someone else already runs the keyboard
+        # Started asynchronously; a failure to start arrives as process_error
+        self.process.start(self.program, [])
+        metrics.inc("keyboard_process_starts")
+        return True
+
+    def show(self):
+        self.hide_timer.stop()
+        if not self.visible and self.ensure_running():
+            self.send("show")
+
+    def hide(self):
+        if self.visible:
+            self.hide_timer.start(self.HIDE_DELAY_MS)
+
+    def send(self, command):
+        self.visible = command == "show"
+        metrics.set("keyboard_visible", int(self.visible))
+        if self.channel is None:
+            return  # onboard shows itself on start and we cannot drive it further
+
+        started = time.monotonic()
+
+        def done(ok):
+            metrics.observe("keyboard_%s_seconds" % command, time.monotonic() - started,
+                            buckets=self.LATENCY_BUCKETS)
+            if not ok:
+                metrics.inc("keyboard_control_errors")
+
+        self.channel.send(command, done)
+
+    def watch_view(self, view):
+        """Show the keyboard while an editable element inside view has focus."""
+        def focus_changed():
+            if view.hasFocus() and view.testAttribute(Qt.WA_InputMethodEnabled):
+                self.show()
+            else:
+                self.hide()
+
+        view.page().microFocusChanged.connect(focus_changed)
+
+    def process_finished(self):
+        self.visible = False
+        metrics.set("keyboard_visible", 0)
+
+    def process_error(self, error):
+        if error == QProcess.FailedToStart:
+            metrics.inc("keyboard_process_errors")
+            self.process_finished()
+
+    def shutdown(self):
+        if self.process.state() != QProcess.NotRunning:
+            self.process.terminate()
+            self.process.waitForFinished(1000)
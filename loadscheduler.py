@@ -0,0 +1,83 @@
+import time
+from PyQt5.QtCore import QObject, QTimer
+
+from metrics import metrics
+
+
+class LoadScheduler(QObject):
+    """Queues tab page loads so only a few parse and run scripts at once.
+
+    Loads are started from the event loop once pending events are handled,
+    so a burst of tab opens only costs the loads that are actually allowed
+    to run. The visible tab always starts first and regardless of the limit;
+    background tabs follow in FIFO order, one per idle pass, while fewer
+    than max_concurrent loads are running.
+    """
+
+    WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, is_visible, max_concurrent=2, parent=None):
+        super(LoadScheduler, self).__init__(parent)
+        self.is_visible = is_visible
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue = []
+        self.active = {}
+
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.pump)
+
+    def load(self, record):
+        self.queue.append((record, time.monotonic()))
+        self.report()
+        self.schedule()
+
+    def promote(self, record):
+        """Start a queued load right away, e.g. when its tab becomes visible."""
+        for position, (queued, enqueued_at) in enumerate(self.queue):
+            if queued is record:
+                del self.queue[position]
+                self.start(record, enqueued_at)
+                return
+
+    def cancel(self, record):
+        self.queue = [(queued, enqueued_at) for queued, enqueued_at in self.queue
+                      if queued is not record]
+        if self.active.pop(record.view, None) is not None:
+            self.schedule()
+        self.report()
+
+    def start(self, record, enqueued_at):
+        view = record.view
+        metrics.observe("tab_load_wait_seconds", time.monotonic() - enqueued_at,
+                        buckets=self.WAIT_BUCKETS)
+        self.active[view] = record
+
+        def finished(ok):
+            view.loadFinished.disconnect(finished)
+            if self.active.pop(view, None) is not None:
+                self.report()
+                self.schedule()
+
+        view.loadFinished.connect(finished)
+        self.report()
+        view.setUrl(record.url)
+
+    def schedule(self):
+        if self.queue and not self.idle_timer.isActive():
+            self.idle_timer.start(0)
+
+    def pump(self):
+        for record, _ in self.queue:
+            if self.is_visible(record):
+                self.promote(record)
+                break
+        if self.queue and len(self.active) < self.max_concurrent:
+            record, enqueued_at = self.queue.pop(0)
+            self.start(record, enqueued_at)
+        self.report()
+        self.schedule()
+
+    def report(self):
+        metrics.set("tab_load_queue_depth", len(self.queue))
+        metrics.set("tab_loads_active", len(self.active))
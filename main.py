@@ -1,51 +1,237 @@
 
 
 
+import time
+STARTUP_ORIGIN = time.perf_counter()
+
 import sys
 import os
-from PyQt5.QtCore import *
+from PyQt5.QtCore import QEvent, QTimer, QUrl, Qt
 from PyQt5.QtGui import QKeySequence
-from PyQt5.QtWidgets import *
-from PyQt5.QtWebKitWidgets import QWebView  
-from PyQt5.QtWebKit import QWebSettings
-import subprocess
+from PyQt5.QtWidgets import (QAction, QActionGroup, QApplication, QHBoxLayout, QLineEdit,
+                             QMainWindow, QMenu, QMessageBox, QShortcut, QTabWidget, QToolBar,
+                             QWidget)
+from PyQt5.QtWebKitWidgets import QWebView
+
+from assetpack import AssetPack, AssetSchemeHandler
+from autohide import NavbarAutoHide
+from cachepolicy import CachePolicy, PROFILES
+from coalesce import Coalescer, parse_micro_cache_rules
+from config import parse_options, parse_url_rules
+from idle import IdleController
+from keyboard import KeyboardManager, default_channel
+from loadscheduler import LoadScheduler
+from memory import MB
+from metricsserver import MetricsServer
+from netarchive import ArchiveRecorder, ArchiveReplayer
+from netpolicy import RequestPolicy
+from network import attach_page, network_manager
+from readiness import HomeSnapshot, ReadinessProbe, STARTING_PAGE
+from session import SessionJournal, SessionState
+from startup import StartupTrace
+from suspend import watch_page
+from swrcache import StaleWhileRevalidate, parse_swr_rules
+from tabs import TabRegistry
+from throttle import THROTTLE_MODES, BackgroundThrottler, parse_throttle_rules
+from tracing import TraceHandler, TracingApplication, trace_view, tracer
+from userscripts import UserScriptManager
+from viewpool import ViewPool
+from watchdog import LagMonitor, StallWatchdog
+
+IMPORTS_DONE = time.perf_counter()
 
 class MainWindow(QMainWindow):
-    def __init__(self, fullscreen=False):
+    def __init__(self, fullscreen=False, options=None, startup_trace=None):
         super(MainWindow, self).__init__()
+        self.options = options if options is not None else parse_options()
+        self.home_url = QUrl(self.options.home_url)
+        self.startup_trace = startup_trace if startup_trace is not None else StartupTrace()
+        self.url_bar = None
+        self.setup_network()
+
+        # Probe the backend while the rest of the window is built
+        self.home_probe = ReadinessProbe(self.home_url, self)
+        self.home_probe.start()
+        self.home_snapshot = HomeSnapshot()
 
         self.tabs = QTabWidget()
         self.tabs.setTabsClosable(True)
         self.tabs.setMovable(True)
         self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.tabs.tabBar().setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tabs.tabBar().customContextMenuRequested.connect(self.show_tab_menu)
         self.setCentralWidget(self.tabs)
-         
-        self.resize(1920, 1080)
+        self.view_pool = ViewPool(self.build_view, self.home_url,
+                                  self.options.view_pool_size, self, start=False)
+        self.load_scheduler = LoadScheduler(lambda record: self.tab_registry.is_current(record),
+                                            self.options.max_concurrent_loads, self)
+        self.tab_registry = TabRegistry(self.tabs, self.view_pool, self.load_scheduler,
+                                        self.connect_view, self.options.tab_memory_budget * MB,
+                                        self)
+        self.tab_registry.current_url_changed.connect(self.update_url)
+        self.tab_registry.tab_activated.connect(
+            lambda record: tracer.instant("tab switch", "ui", url=record.url.toString()))
+        self.session = SessionJournal(self.options.session, self)
+
+        # Maximized windows only need the size for restoring
+        if fullscreen or not self.options.fast_start:
+            self.resize(1920, 1080)
         self.setMouseTracking(True)
         self.tabs.setMouseTracking(True)
 
         self.disable_cache_and_history()
+        self.keyboard = KeyboardManager(channel=default_channel(self.options.keyboard_control),
+                                        parent=self)
+        self.user_scripts = UserScriptManager([os.path.abspath(self.options.emode_script)], self)
+        self.throttler = BackgroundThrottler(
+            self.tab_registry, self.options.background_throttle,
+            self.options.background_throttle_period,
+            parse_throttle_rules(parse_url_rules(self.options.background_throttle_rules)), self)
+        self.idle = IdleController(self.tab_registry, self.options.idle_timeout,
+                                   self.options.idle_fps, self.options.idle_screenshot, self)
+        self.idle.idle_changed.connect(self.idle_changed)
+        self.start_watchdog()
+        self.metrics_server = None
+        if self.options.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.options.metrics_port).start()
+            except OSError as error:
+                sys.stderr.write("metrics server not started: %s\n" % error)
+
+        self.is_fullscreen = fullscreen
+        self.is_maximized = True
+
+        if self.options.fast_start:
+            # Paint and start the home load first, build the rest once the loop runs
+            self.open_initial_tabs()
+            self.show_initial()
+            QTimer.singleShot(0, self.create_secondary_ui)
+        else:
+            self.create_secondary_ui()
+            self.open_initial_tabs()
+            self.show_initial()
+        self.startup_trace.mark("window_constructed")
+
+    def setup_network(self):
+        manager = network_manager()
+        self.network_archive = None
+        if manager.handlers:
+            return  # already configured by an earlier window
+        if tracer.enabled:
+            manager.add_handler(TraceHandler())
+        if os.path.exists(self.options.asset_pack):
+            try:
+                manager.add_handler(AssetSchemeHandler(AssetPack(self.options.asset_pack)))
+            except (OSError, ValueError) as error:
+                sys.stderr.write("asset pack not loaded: %s\n" % error)
+        if self.options.replay_archive:
+            # Pages only ever see the archive, so nothing below it is needed
+            manager.add_handler(ArchiveReplayer(self.options.replay_archive,
+                                                self.options.replay_latency))
+            return
+        if self.options.record_archive:
+            self.network_archive = ArchiveRecorder(self.options.record_archive)
+            manager.add_handler(self.network_archive)
+        if self.options.swr_cache_size:
+            rules = parse_swr_rules(parse_url_rules(self.options.swr_policies))
+            manager.add_handler(StaleWhileRevalidate(rules, self.options.swr_cache_size * MB))
+        if not self.options.no_coalesce:
+            rules = parse_micro_cache_rules(parse_url_rules(self.options.micro_cache))
+            manager.add_handler(Coalescer(rules))
+        manager.add_handler(RequestPolicy(
+            connect_timeout_ms=self.options.connect_timeout,
+            read_timeout_ms=self.options.read_timeout,
+            retries=self.options.retries,
+            hedging=self.options.hedge_percentile > 0,
+            hedge_percentile=self.options.hedge_percentile,
+            host_limit=self.options.host_concurrency,
+            long_poll=[pattern for pattern, _ in parse_url_rules(self.options.long_poll)],
+        ))
+
+    def create_secondary_ui(self):
         self.create_shortcuts()
 
         # Navigation Toolbar
         self.navbar = QToolBar()
         self.addToolBar(Qt.TopToolBarArea, self.navbar)
         self.navbar.setMovable(False)
-        self.navbar.setHidden(fullscreen)
+        self.navbar.setHidden(self.is_fullscreen)
 
         self.create_nav_buttons()
-
-        # Open Home Tab
-        self.add_new_tab(QUrl("http://127.0.0.1:8005"), "Home")
-
-        if fullscreen:
+        self.navbar_autohide = NavbarAutoHide(self, self.navbar, self)
+        self.navbar_autohide.set_enabled(self.is_fullscreen)
+
+        record = self.tab_registry.current_record()
+        if record is not None:
+            self.update_url(record.url)
+        self.startup_trace.mark("secondary_ui_built")
+
+    def open_initial_tabs(self):
+        state = SessionState() if self.options.no_session_restore else self.session.read()
+        if state.tabs:
+            self.restore_session(state)
+        else:
+            self.open_home_tab()
+        self.session.attach(self.tab_registry)
+
+    def restore_session(self, state):
+        # Only the active tab gets a view, the rest load when first shown
+        ready = self.home_probe.is_ready
+        records = self.tab_registry.restore(state.entries(), state.active_index(), load=ready)
+        if ready:
+            self.view_pool.start()
+            return
+
+        # Hold every load until the backend answers rather than show error pages
+        current = self.tab_registry.current_record()
+        snapshot = self.home_snapshot.load() if current.url == self.home_url else None
+        if snapshot:
+            current.view.setHtml(snapshot, self.home_url)
+        else:
+            current.view.hide()
+            current.host.show_placeholder(None)
+        self.home_probe.ready.connect(lambda: self.load_restored_tabs(records))
+
+    def load_restored_tabs(self, records):
+        self.view_pool.start()
+        for record in records:
+            if record.view is not None:
+                record.host.clear_placeholder()
+                record.view.show()
+            self.tab_registry.start_manual_load(record)
+
+    def open_home_tab(self):
+        record = self.tab_registry.add(self.home_url, "Home", load=False)
+        if self.home_probe.is_ready:
+            self.load_live_home(record)
+            return
+
+        # Never boot to a blank page: show the last good render until the backend answers
+        record.view.setHtml(self.home_snapshot.load() or STARTING_PAGE, self.home_url)
+        self.home_probe.ready.connect(lambda: self.load_live_home(record))
+
+    def load_live_home(self, record):
+        self.view_pool.start()
+        view = record.view
+        if view is None or record.url != self.home_url:
+            return  # discarded or navigated away while waiting
+
+        def finished(ok):
+            view.loadFinished.disconnect(finished)
+            if ok and view.url() == self.home_url:
+                self.home_snapshot.save(view.page().mainFrame().toHtml())
+
+        view.loadFinished.connect(finished)
+        self.startup_trace.watch_home_load(view)
+        view.setUrl(self.home_url)
+
+    def show_initial(self):
+        self.startup_trace.watch_first_paint(self)
+        if self.is_fullscreen:
             self.showFullScreen()
         else:
             self.showMaximized()
 
-        self.is_fullscreen = fullscreen
-        self.is_maximized = True
-
     def create_shortcuts(self):
         shortcuts = {
             "Ctrl+T": lambda: self.add_new_tab(),
@@ -63,14 +249,53 @@ class MainWindow(QMainWindow):
         }
         
         for shortcut, function in shortcuts.items():
-            QShortcut(QKeySequence(shortcut), self).activated.connect(function)
+            QShortcut(QKeySequence(shortcut), self).activated.connect(
+                tracer.traced("shortcut " + shortcut, "ui", function))
+
+    def start_watchdog(self):
+        self.lag_monitor = LagMonitor(self.tab_urls, self)
+        self.lag_monitor.start()
+        self.stall_watchdog = None
+        if self.options.stall_threshold > 0:
+            self.stall_watchdog = StallWatchdog(self.lag_monitor, self.options.stall_threshold,
+                                                self.options.stall_log)
+            self.stall_watchdog.start()
+
+    def idle_changed(self, idle):
+        # Tabs opened, discarded or re-rendered while idle get their throttle back on resume
+        if not idle:
+            self.throttler.apply_all()
+
+    def tab_urls(self):
+        return [self.tab_registry.record_at(index).url.toString()
+                for index in range(self.tabs.count())]
+
+    def show_tab_menu(self, pos):
+        record = self.tab_registry.record_at(self.tabs.tabBar().tabAt(pos))
+        if record is None:
+            return
+        menu = QMenu(self)
+        throttle_menu = menu.addMenu("In background")
+        group = QActionGroup(throttle_menu)
+        for mode in (None,) + THROTTLE_MODES:
+            action = throttle_menu.addAction("default" if mode is None else mode)
+            action.setCheckable(True)
+            action.setChecked(record.throttle == mode)
+            action.triggered.connect(lambda checked, mode=mode:
+                                     self.throttler.set_tab_mode(record, mode))
+            group.addAction(action)
+        menu.exec_(self.tabs.tabBar().mapToGlobal(pos))
 
     def disable_cache_and_history(self):
-        pass
+        profile = PROFILES[self.options.cache_profile]
+        self.cache_policy = CachePolicy(profile, self.options.memory_ceiling * MB,
+                                        self.options.disk_cache_backend)
+        self.cache_policy.apply()
+        self.cache_policy.start_memory_guard(self)
 
     def create_nav_buttons(self):
         buttons = [
-            ("+", self.add_new_tab),
+            ("+", lambda: self.add_new_tab()),
             ("Back", lambda: self.current_browser().back()),
             ("Forward", lambda: self.current_browser().forward()),
             ("Reload", lambda: self.current_browser().reload()),
@@ -95,43 +320,57 @@ class MainWindow(QMainWindow):
         nav_container.setLayout(nav_layout)
         self.navbar.addWidget(nav_container)
 
-    def add_new_tab(self, qurl=QUrl("http://127.0.0.1:8005"), label="New Tab"):
-        browser = QWebView()
-        browser.setUrl(qurl)
-        index = self.tabs.addTab(browser, label)
-        self.tabs.setCurrentIndex(index)
+    def add_new_tab(self, qurl=None, label="New Tab", background=False):
+        return self.tab_registry.add(qurl or self.home_url, label, background)
 
-        # Update Tab Title When Page Loads
-        browser.titleChanged.connect(lambda: self.update_tab_title(index, browser))
-        browser.urlChanged.connect(lambda q, b=browser: self.update_url(q, b))
+    def build_view(self):
+        browser = QWebView()
+        attach_page(browser.page())
+        watch_page(browser.page())
+        self.cache_policy.configure_page(browser.page())
+        return browser
 
-    def update_tab_title(self, index, browser):
-        title = browser.page().mainFrame().title()
-        self.tabs.setTabText(index, title if title else "Loading...")
+    def connect_view(self, browser, record):
+        self.keyboard.watch_view(browser)
+        self.user_scripts.watch_view(browser)
+        if tracer.enabled:
+            trace_view(browser, record)
 
     def current_browser(self):
-        return self.tabs.currentWidget()
+        return self.tab_registry.current_view()
 
     def close_tab(self, index):
         if self.tabs.count() > 1:
-            self.tabs.removeTab(index)
+            self.tab_registry.remove(index)
         else:
             self.close_browser()  # Close the browser if it's the last tab
 
     def navigate_home(self):
-        self.current_browser().setUrl(QUrl("http://127.0.0.1:8005"))
+        self.current_browser().setUrl(self.home_url)
 
     def navigate_to_url(self):
         url = self.url_bar.text()
         self.current_browser().setUrl(QUrl(url))
 
-    def update_url(self, q, browser):
-        if browser == self.current_browser():
+    def update_url(self, q):
+        if self.url_bar is not None:
             self.url_bar.setText(q.toString())
 
     def close_browser(self):
         self.close()
 
+    def closeEvent(self, event):
+        self.session.close()
+        if self.network_archive is not None:
+            self.network_archive.close()
+        if self.stall_watchdog is not None:
+            self.stall_watchdog.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.keyboard.shutdown()
+        self.view_pool.clear()
+        super().closeEvent(event)
+
     def next_tab(self):
         index = self.tabs.currentIndex()
         self.tabs.setCurrentIndex((index + 1) % self.tabs.count())
@@ -143,6 +382,8 @@ class MainWindow(QMainWindow):
     def eventFilter(self, obj, event):
         if obj == self.url_bar and event.type() == QEvent.FocusIn:
             self.show_virtual_keyboard()
+        elif obj == self.url_bar and event.type() == QEvent.FocusOut:
+            self.keyboard.hide()
         return super().eventFilter(obj, event)
 
     def toggle_maximize_restore(self):
@@ -162,17 +403,10 @@ class MainWindow(QMainWindow):
             self.showFullScreen()
             self.navbar.hide()
         self.is_fullscreen = not self.is_fullscreen
-
-    def mouseMoveEvent(self, event):
-        if self.is_fullscreen:
-            if event.pos().y() < 40:  # If mouse is near the top (40px threshold)
-                self.navbar.show()
-            else:
-                QTimer.singleShot(1000, self.navbar.hide)  # Hide after 1s if not near the top
-        super().mouseMoveEvent(event)
+        self.navbar_autohide.set_enabled(self.is_fullscreen)
 
     def show_virtual_keyboard(self):
-        QProcess.startDetached("onboard")
+        self.keyboard.show()
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
@@ -181,20 +415,27 @@ class MainWindow(QMainWindow):
             super().keyPressEvent(event)
 
     def open_emodeui_js(self):
-        js_file = os.path.join(os.getcwd(), "emodeui.js")
-
-        if os.path.exists(js_file):
-            try:
-                subprocess.Popen(["node", js_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                QMessageBox.information(self, "Execution", "emodeui.js is running!")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to execute emodeui.js: {e}")
+        script = self.user_scripts.script(os.path.basename(self.options.emode_script))
+
+        if script.refresh():
+            # The window-level Escape shortcut swallows the key, so replay it to the page
+            frame = self.current_browser().page().mainFrame()
+            frame.evaluateJavaScript(script.source)
+            frame.evaluateJavaScript(
+                "if (window.jQuery) { jQuery(document).trigger(jQuery.Event('keydown', {key: 'Escape'})); }")
         else:
             QMessageBox.critical(self, "Error", "emodeui.js not found!")
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    options = parse_options(sys.argv[1:])
+    startup_trace = StartupTrace(options.startup_trace, STARTUP_ORIGIN)
+    startup_trace.mark("imports", IMPORTS_DONE)
+    if options.trace:
+        tracer.start(options.trace)
+    app = (TracingApplication if options.trace else QApplication)(sys.argv)
     QApplication.setApplicationName("Supernova Surfer")
-    fullscreen = "--fullscreen" in sys.argv  
-    window = MainWindow(fullscreen)
-    app.exec_()
+    startup_trace.mark("qapplication_created")
+    window = MainWindow(options.fullscreen, options, startup_trace)
+    status = app.exec_()
+    tracer.stop()
+    sys.exit(status)
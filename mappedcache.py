@@ -0,0 +1,362 @@
+import mmap
+import os
+import struct
+from PyQt5.QtCore import QBuffer, QByteArray, QDataStream, QIODevice, QUrl
+from PyQt5 import sip
+from PyQt5.QtNetwork import QAbstractNetworkCache, QNetworkCacheMetaData
+
+from metrics import metrics
+
+
+MAGIC = b"SNVCACHE"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQ")      # magic, version, reserved, end offset
+HEADER_SIZE = 64
+RECORD = struct.Struct("<IIQ")        # key length, metadata length, body length
+TOMBSTONE = 0xFFFFFFFFFFFFFFFF
+METADATA_ONLY = 0xFFFFFFFFFFFFFFFE  # new metadata for the key's existing body
+LOW_WATER = 0.75                     # share of the file left live after evicting
+
+
+class MappedReader(QIODevice):
+    """Read-only device over a byte range of a memory-mapped cache file.
+
+    Reads slice the mapping directly, so a cached body is never copied into
+    an intermediate buffer on its way to the reply.
+    """
+
+    def __init__(self, mapping, offset, length, parent=None):
+        super(MappedReader, self).__init__(parent)
+        self.mapping = mapping
+        self.offset = offset
+        self.length = length
+        self.cursor = 0
+        self.open(QIODevice.ReadOnly | QIODevice.Unbuffered)
+
+    def readData(self, maxlen):
+        count = min(maxlen, self.length - self.cursor)
+        start = self.offset + self.cursor
+        self.cursor += count
+        return self.mapping[start:start + count]
+
+    def seek(self, position):
+        if not 0 <= position <= self.length:
+            return False
+        self.cursor = position
+        return super(MappedReader, self).seek(position)
+
+    def size(self):
+        return self.length
+
+    def bytesAvailable(self):
+        return self.length - self.cursor + super(MappedReader, self).bytesAvailable()
+
+    def isSequential(self):
+        return False
+
+    def writeData(self, data):
+        return -1
+
+
+def serialize_metadata(metadata):
+    data = QByteArray()
+    stream = QDataStream(data, QIODevice.WriteOnly)
+    stream << metadata
+    return bytes(data)
+
+
+def deserialize_metadata(data):
+    metadata = QNetworkCacheMetaData()
+    buffer = QByteArray(data)
+    stream = QDataStream(buffer, QIODevice.ReadOnly)
+    stream >> metadata
+    return metadata
+
+
+class MappedDiskCache(QAbstractNetworkCache):
+    """HTTP cache packed into one preallocated, memory-mapped file.
+
+    Entries are appended as key/metadata/body records and located through an
+    in-memory index rebuilt by scanning the file at startup. Revalidated
+    entries get their metadata rewritten in place when it fits, or else a
+    metadata-only record that keeps the existing body. Removals append
+    tombstones; once dead records take up half of the file, or an insert
+    does not fit, live records are compacted into a fresh file. When the
+    cache is full the oldest entries are evicted down to LOW_WATER first,
+    so the cost of a compaction is spread over many later inserts. This
+    keeps writes sequential on SD cards instead of creating a file per
+    entry.
+    """
+
+    def __init__(self, path, capacity, parent=None):
+        super(MappedDiskCache, self).__init__(parent)
+        self.path = path
+        self.capacity = max(capacity, HEADER_SIZE + RECORD.size)
+        self.index = {}
+        self.pending = {}
+        self.live_bytes = 0
+        self.end = HEADER_SIZE
+        self.mapping = None
+        self.open()
+
+    # File management
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) == self.capacity
+        self.mapping = self.map_file(self.path, self.capacity)
+        magic, version, _, end = HEADER.unpack_from(self.mapping, 0)
+        if exists and magic == MAGIC and version == VERSION and HEADER_SIZE <= end <= self.capacity:
+            self.end = end
+            self.scan()
+        else:
+            self.reset()
+
+    @staticmethod
+    def map_file(path, capacity):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != capacity:
+                os.ftruncate(fd, capacity)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, capacity)
+            return mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+
+    def write_header(self, mapping=None, end=None):
+        HEADER.pack_into(mapping or self.mapping, 0, MAGIC, VERSION, 0,
+                         self.end if end is None else end)
+
+    def reset(self):
+        self.index.clear()
+        self.live_bytes = 0
+        self.end = HEADER_SIZE
+        self.write_header()
+
+    def scan(self):
+        position = HEADER_SIZE
+        while position + RECORD.size <= self.end:
+            key_length, meta_length, body_length = RECORD.unpack_from(self.mapping, position)
+            key_start = position + RECORD.size
+            key = bytes(self.mapping[key_start:key_start + key_length])
+            if body_length == TOMBSTONE:
+                self.drop(key)
+                position = key_start + key_length
+                continue
+            if body_length == METADATA_ONLY:
+                size = RECORD.size + key_length + meta_length
+                if position + size > self.end:
+                    break
+                self.replace_metadata(key, key_start + key_length, meta_length)
+                position += size
+                continue
+            size = RECORD.size + key_length + meta_length + body_length
+            if position + size > self.end:
+                break  # torn write at the tail
+            self.drop(key)
+            self.add(key, (key_start + key_length, meta_length,
+                           key_start + key_length + meta_length, body_length))
+            position += size
+        self.end = position
+        self.write_header()
+
+    @staticmethod
+    def record_size(key, entry):
+        """Bytes the entry takes up once compacted into a single record."""
+        _, meta_length, _, body_length = entry
+        return RECORD.size + len(key) + meta_length + body_length
+
+    def add(self, key, entry):
+        self.index[key] = entry
+        self.live_bytes += self.record_size(key, entry)
+
+    def drop(self, key):
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self.live_bytes -= self.record_size(key, entry)
+
+    def replace_metadata(self, key, meta_offset, meta_length):
+        entry = self.index.get(key)
+        if entry is not None:
+            _, _, body_offset, body_length = entry
+            self.live_bytes -= self.record_size(key, entry)
+            self.add(key, (meta_offset, meta_length, body_offset, body_length))
+
+    def write_record(self, key, meta, body_length, body=b""):
+        position = self.end
+        RECORD.pack_into(self.mapping, position, len(key), len(meta), body_length)
+        start = position + RECORD.size
+        self.mapping[start:start + len(key)] = key
+        start += len(key)
+        self.mapping[start:start + len(meta)] = meta
+        start += len(meta)
+        self.mapping[start:start + len(body)] = body
+        self.end = start + len(body)
+        self.write_header()
+        return position + RECORD.size + len(key)
+
+    def append(self, key, meta, body):
+        if not self.make_room(RECORD.size + len(key) + len(meta) + len(body)):
+            return False
+        meta_offset = self.write_record(key, meta, len(body), body)
+        self.drop(key)
+        self.add(key, (meta_offset, len(meta), meta_offset + len(meta), len(body)))
+        self.compact_if_sparse()
+        return True
+
+    def append_metadata(self, key, meta):
+        size = RECORD.size + len(key) + len(meta)
+        if self.end + size > self.capacity:
+            self.compact()
+            if self.end + size > self.capacity:
+                return  # keep serving the old metadata
+        meta_offset = self.write_record(key, meta, METADATA_ONLY)
+        self.replace_metadata(key, meta_offset, len(meta))
+        self.compact_if_sparse()
+
+    def compact_if_sparse(self):
+        if self.dead_bytes() > (self.capacity - HEADER_SIZE) // 2:
+            self.compact()
+
+    def append_tombstone(self, key):
+        size = RECORD.size + len(key)
+        if self.end + size > self.capacity:
+            self.compact()  # compaction drops the entry for good
+            return
+        RECORD.pack_into(self.mapping, self.end, len(key), 0, TOMBSTONE)
+        self.mapping[self.end + RECORD.size:self.end + size] = key
+        self.end += size
+        self.write_header()
+
+    def dead_bytes(self):
+        return self.end - HEADER_SIZE - self.live_bytes
+
+    def make_room(self, size):
+        if HEADER_SIZE + size > self.capacity:
+            return False
+        if self.end + size <= self.capacity:
+            return True
+        if HEADER_SIZE + self.live_bytes + size > self.capacity:
+            # Evicting just enough for this insert would compact on every later one
+            low_water = (self.capacity - HEADER_SIZE) * LOW_WATER
+            while self.live_bytes + size > low_water and self.index:
+                # Index order is insertion order, so the first key is the oldest
+                self.drop(next(iter(self.index)))
+        self.compact()
+        return self.end + size <= self.capacity
+
+    def compact(self, capacity=None):
+        """Rewrite live records into a fresh file, optionally of a new size."""
+        capacity = capacity or self.capacity
+        partial = self.path + ".compact"
+        mapping = self.map_file(partial, capacity)
+        position = HEADER_SIZE
+        index = {}
+        live_bytes = 0
+        for key, (meta_offset, meta_length, body_offset, body_length) in self.index.items():
+            size = RECORD.size + len(key) + meta_length + body_length
+            if position + size > capacity:
+                continue
+            # Metadata and body may sit in different records, so rebuild one
+            RECORD.pack_into(mapping, position, len(key), meta_length, body_length)
+            start = position + RECORD.size
+            mapping[start:start + len(key)] = key
+            start += len(key)
+            mapping[start:start + meta_length] = self.mapping[meta_offset:meta_offset + meta_length]
+            mapping[start + meta_length:start + meta_length + body_length] = \
+                self.mapping[body_offset:body_offset + body_length]
+            index[key] = (start, meta_length, start + meta_length, body_length)
+            live_bytes += size
+            position += size
+        self.write_header(mapping, position)
+        mapping.flush()
+        metrics.inc("disk_cache_compactions")
+        metrics.inc("disk_cache_compacted_bytes", position - HEADER_SIZE)
+        os.replace(partial, self.path)
+
+        # Open readers keep the old mapping alive until they are deleted
+        self.mapping = mapping
+        self.capacity = capacity
+        self.index = index
+        self.live_bytes = live_bytes
+        self.end = position
+
+    def setMaximumCacheSize(self, capacity):
+        if capacity != self.capacity:
+            self.compact(max(capacity, HEADER_SIZE + RECORD.size))
+
+    def maximumCacheSize(self):
+        return self.capacity
+
+    # QAbstractNetworkCache
+
+    @staticmethod
+    def key(url):
+        return bytes(url.toEncoded(QUrl.RemoveFragment))
+
+    def metaData(self, url):
+        entry = self.index.get(self.key(url))
+        metrics.inc("disk_cache_lookups", result="miss" if entry is None else "hit")
+        if entry is None:
+            return QNetworkCacheMetaData()
+        meta_offset, meta_length, _, _ = entry
+        return deserialize_metadata(self.mapping[meta_offset:meta_offset + meta_length])
+
+    def updateMetaData(self, metadata):
+        key = self.key(metadata.url())
+        entry = self.index.get(key)
+        if entry is None:
+            return
+        meta_offset, meta_length, _, _ = entry
+        meta = serialize_metadata(metadata)
+        if len(meta) <= meta_length:
+            # Trailing padding is never read back by deserialize_metadata
+            self.mapping[meta_offset:meta_offset + meta_length] = \
+                meta + bytes(meta_length - len(meta))
+        else:
+            self.append_metadata(key, meta)
+
+    def data(self, url):
+        entry = self.index.get(self.key(url))
+        if entry is None:
+            return None
+        _, _, body_offset, body_length = entry
+        metrics.inc("disk_cache_bytes_served", body_length)
+        reader = MappedReader(self.mapping, body_offset, body_length)
+        sip.transferto(reader, None)  # the caller deletes the device
+        return reader
+
+    def remove(self, url):
+        key = self.key(url)
+        for device_id, (device, metadata) in list(self.pending.items()):
+            if self.key(metadata.url()) == key:
+                del self.pending[device_id]
+                device.deleteLater()
+        if key not in self.index:
+            return False
+        self.drop(key)
+        self.append_tombstone(key)
+        return True
+
+    def cacheSize(self):
+        return self.end - HEADER_SIZE
+
+    def prepare(self, metadata):
+        if not metadata.isValid() or not metadata.saveToDisk():
+            return None
+        device = QBuffer()
+        device.open(QIODevice.ReadWrite)
+        self.pending[id(device)] = (device, metadata)
+        return device
+
+    def insert(self, device):
+        device, metadata = self.pending.pop(id(device), (None, None))
+        if device is None:
+            return
+        self.append(self.key(metadata.url()), serialize_metadata(metadata), bytes(device.data()))
+        device.deleteLater()
+
+    def clear(self):
+        self.reset()
+        self.compact()
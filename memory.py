@@ -0,0 +1,13 @@
+MB = 1024 * 1024
+
+
+def resident_set_size():
+    """Return the resident set size of this process in bytes, 0 if unknown."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
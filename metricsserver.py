@@ -0,0 +1,152 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from memory import resident_set_size
+from metrics import metrics
+
+
+PREFIX = "supernova_"
+CHILD_PROCESSES = ("onboard", "node")
+
+# (ratio label, counter, labels counted as hits, labels counted at all)
+HIT_RATIOS = (
+    ("swr", "http_cache_requests", ("fresh", "stale"), ("fresh", "stale", "expired", "miss")),
+    ("disk", "disk_cache_lookups", ("hit",), ("hit", "miss")),
+)
+
+
+def child_process_counts(names):
+    """Count this process's running children per command name from /proc."""
+    counts = dict.fromkeys(names, 0)
+    parent = os.getpid()
+    try:
+        pids = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return counts
+    for pid in pids:
+        try:
+            with open("/proc/%s/stat" % pid) as stat:
+                fields = stat.read()
+        except OSError:
+            continue
+        # "pid (comm) state ppid ...", where comm may itself contain spaces
+        name = fields[fields.find("(") + 1:fields.rfind(")")]
+        rest = fields[fields.rfind(")") + 2:].split()
+        if name in counts and len(rest) > 1 and rest[1] == str(parent):
+            counts[name] += 1
+    return counts
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+def number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def hit_ratios(counters):
+    ratios = []
+    for cache, name, hits, counted in HIT_RATIOS:
+        by_result = {dict(labels).get("result"): value
+                     for (counter, labels), value in counters.items() if counter == name}
+        total = sum(by_result.get(result, 0) for result in counted)
+        if total:
+            ratios.append(((("cache", cache),), sum(by_result.get(result, 0) for result in hits)
+                           / float(total)))
+    pool_hits = counters.get(("view_pool_hits", ()), 0)
+    pool_total = pool_hits + counters.get(("view_pool_misses", ()), 0)
+    if pool_total:
+        ratios.append(((("cache", "view_pool"),), pool_hits / float(pool_total)))
+    return ratios
+
+
+def render():
+    """Return the metrics registry and process stats in Prometheus text format.
+
+    Only the registry's locked snapshot and /proc are read, so this is safe
+    to call from any thread.
+    """
+    counters, gauges, histograms = metrics.snapshot()
+    gauges[("process_resident_memory_bytes", ())] = resident_set_size()
+    for name, count in child_process_counts(CHILD_PROCESSES).items():
+        gauges[("child_processes", (("name", name),))] = count
+    for labels, ratio in hit_ratios(counters):
+        gauges[("cache_hit_ratio", labels)] = ratio
+
+    lines = []
+    for kind, series in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({name for name, _ in series}):
+            metric = PREFIX + name + ("_total" if kind == "counter" else "")
+            lines.append("# TYPE %s %s" % (metric, kind))
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name == name:
+                    lines.append("%s%s %s" % (metric, labels_text(labels), number(value)))
+
+    for name in sorted({name for name, _ in histograms}):
+        metric = PREFIX + name
+        lines.append("# TYPE %s histogram" % metric)
+        for (series_name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (metric, labels_text(labels, [("le", number(bound))]),
+                                                 cumulative))
+            lines.append("%s_sum%s %s" % (metric, labels_text(labels), number(histogram.sum)))
+            lines.append("%s_count%s %d" % (metric, labels_text(labels), histogram.count))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    """Serves /metrics on a loopback port from a daemon thread.
+
+    Scrapes never touch the GUI thread: everything they report is either
+    in the metrics registry already or read from /proc.
+    """
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server",
+                                       daemon=True)
+
+    @property
+    def url(self):
+        return "http://%s:%d/metrics" % self.httpd.server_address[:2]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
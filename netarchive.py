@@ -0,0 +1,203 @@
+import collections
+import gzip
+import json
+import struct
+import time
+import zlib
+
+from PyQt5.QtCore import QTimer, QUrl
+from PyQt5.QtNetwork import QNetworkReply
+
+from metrics import metrics
+from network import network_manager
+from networkreply import ProxyReply
+from tracing import OPERATIONS
+
+
+MAGIC = b"SNARCHIVE1\n"
+LENGTH = struct.Struct(">I")
+ARCHIVED_SCHEMES = ("http", "https")
+
+
+def request_key(operation, url):
+    return OPERATIONS.get(operation, "CUSTOM"), url.toString(QUrl.FullyEncoded)
+
+
+def without_query(url):
+    return url.adjusted(QUrl.RemoveQuery | QUrl.RemoveFragment)
+
+
+class ArchiveEntry(object):
+    __slots__ = ("method", "url", "status", "reason", "headers", "body", "ttfb", "duration",
+                 "error")
+
+    def __init__(self, method, url, status, reason, headers, body, ttfb, duration, error=0):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.ttfb = ttfb
+        self.duration = duration
+        self.error = error
+
+
+def write_entry(stream, entry):
+    meta = json.dumps({
+        "method": entry.method, "url": entry.url, "status": entry.status,
+        "reason": entry.reason, "ttfb": entry.ttfb, "duration": entry.duration,
+        "error": entry.error,
+        "headers": [[name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in entry.headers],
+    }, separators=(",", ":")).encode("utf-8")
+    stream.write(LENGTH.pack(len(meta)) + meta + LENGTH.pack(len(entry.body)) + entry.body)
+
+
+class TornArchive(Exception):
+    pass
+
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise TornArchive()
+    return data
+
+
+def read_archive(path):
+    """Yield the ArchiveEntry records of a gzip-compressed archive file.
+
+    A recording that was killed leaves a torn tail; reading stops at the
+    last complete entry.
+    """
+    with gzip.open(path, "rb") as stream:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a network archive" % path)
+        while True:
+            try:
+                prefix = stream.read(LENGTH.size)
+                if not prefix:
+                    return
+                if len(prefix) < LENGTH.size:
+                    raise TornArchive()
+                meta = json.loads(read_exact(stream, LENGTH.unpack(prefix)[0]).decode("utf-8"))
+                body = read_exact(stream, LENGTH.unpack(read_exact(stream, LENGTH.size))[0])
+            except (TornArchive, EOFError, zlib.error, ValueError):
+                metrics.inc("net_archive_torn")
+                return
+            headers = [(name.encode("latin-1"), value.encode("latin-1"))
+                       for name, value in meta["headers"]]
+            yield ArchiveEntry(meta["method"], meta["url"], meta["status"], meta["reason"],
+                               headers, body, meta["ttfb"], meta["duration"], meta["error"])
+
+
+class ArchiveRecorder(object):
+    """Network handler that appends every HTTP response pages receive to an archive.
+
+    Status, headers, body, time to headers and total time are captured as
+    the response streams through to the page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = gzip.open(path, "wb")
+        self.stream.write(MAGIC)
+
+    def handle(self, operation, request, data, forward):
+        url = request.url()
+        if url.scheme() not in ARCHIVED_SCHEMES or self.stream is None:
+            return forward(operation, request, data)
+
+        method, address = request_key(operation, url)
+        started = time.perf_counter()
+        response = {"ttfb": 0.0, "metadata": (None, None, []), "body": bytearray()}
+
+        def on_metadata(status, reason, headers):
+            response["ttfb"] = time.perf_counter() - started
+            response["metadata"] = (status, reason, headers)
+
+        def on_finished(error):
+            if error == QNetworkReply.OperationCanceledError or self.stream is None:
+                return
+            status, reason, headers = response["metadata"]
+            self.record(ArchiveEntry(method, address, status, reason, headers,
+                                     bytes(response["body"]), response["ttfb"],
+                                     time.perf_counter() - started, int(error)))
+
+        reply = ProxyReply(operation, request, network_manager())
+        reply.follow(forward(operation, request, data), on_metadata,
+                     response["body"].extend, on_finished)
+        return reply
+
+    def record(self, entry):
+        write_entry(self.stream, entry)
+        # A sync flush makes everything so far readable if the run is killed
+        self.stream.flush()
+        metrics.inc("net_archive_recorded")
+        metrics.inc("net_archive_recorded_bytes", len(entry.body))
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class ArchiveReplayer(object):
+    """Network handler that answers HTTP requests from a recorded archive.
+
+    Repeated recordings of one URL, such as a polled endpoint, are replayed
+    in order and the last one is repeated after that. A request with no
+    exact match falls back to the same URL without its query string, which
+    covers cache-busting parameters. Anything else fails as not found, so
+    a replay never reaches the network. With latency the recorded time to
+    headers and total time are replayed too.
+    """
+
+    def __init__(self, path, latency=False):
+        self.latency = latency
+        self.entries = collections.defaultdict(list)
+        self.fallbacks = collections.defaultdict(list)
+        self.served = collections.Counter()
+        for entry in read_archive(path):
+            self.entries[(entry.method, entry.url)].append(entry)
+            stripped = without_query(QUrl(entry.url)).toString(QUrl.FullyEncoded)
+            self.fallbacks[(entry.method, stripped)].append(entry)
+
+    def lookup(self, operation, url):
+        for entries, key in ((self.entries, request_key(operation, url)),
+                             (self.fallbacks, request_key(operation, without_query(url)))):
+            recorded = entries.get(key)
+            if recorded:
+                position = self.served[key]
+                self.served[key] += 1
+                return recorded[min(position, len(recorded) - 1)]
+        return None
+
+    def handle(self, operation, request, data, forward):
+        url = request.url()
+        if url.scheme() not in ARCHIVED_SCHEMES:
+            return forward(operation, request, data)
+
+        reply = ProxyReply(operation, request, network_manager())
+        entry = self.lookup(operation, url)
+        if entry is None:
+            metrics.inc("net_archive_misses")
+            QTimer.singleShot(0, lambda: reply.finish(QNetworkReply.ContentNotFoundError,
+                                                      "Not in the network archive"))
+            return reply
+
+        metrics.inc("net_archive_hits")
+
+        def metadata():
+            if not reply.done:
+                reply.set_metadata(entry.status, entry.reason, entry.headers)
+
+        def body():
+            reply.append(entry.body)
+            reply.finish(QNetworkReply.NetworkError(entry.error))
+
+        ttfb, duration = (entry.ttfb, max(entry.duration, entry.ttfb)) if self.latency else (0, 0)
+        QTimer.singleShot(int(ttfb * 1000), metadata)
+        QTimer.singleShot(int(duration * 1000), body)
+        return reply
@@ -0,0 +1,270 @@
+import collections
+import fnmatch
+import time
+from PyQt5.QtCore import QObject, QTimer, QUrl
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from metrics import metrics
+from network import network_manager
+from networkreply import ProxyReply, reply_metadata
+
+
+IDEMPOTENT = (QNetworkAccessManager.GetOperation, QNetworkAccessManager.HeadOperation)
+RETRYABLE_ERRORS = (QNetworkReply.ConnectionRefusedError, QNetworkReply.RemoteHostClosedError,
+                    QNetworkReply.TimeoutError, QNetworkReply.TemporaryNetworkFailureError,
+                    QNetworkReply.NetworkSessionFailedError, QNetworkReply.UnknownNetworkError,
+                    QNetworkReply.ProxyTimeoutError)
+RETRYABLE_STATUS = (502, 503, 504)
+
+
+class LatencyTracker(object):
+    """Rolling time-to-headers samples per host, used to pick hedge delays."""
+
+    WINDOW = 100
+    MIN_SAMPLES = 20
+
+    def __init__(self, percentile, floor):
+        self.percentile = percentile
+        self.floor = floor
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.WINDOW))
+
+    def record(self, host, seconds):
+        self.samples[host].append(seconds)
+
+    def threshold(self, host):
+        samples = self.samples[host]
+        if len(samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        return max(ordered[index], self.floor)
+
+
+class PolicyRequest(QObject):
+    """One page request with its upstream attempts, timers and retries.
+
+    Attempts race until one delivers response headers; from then on that
+    attempt is committed and streamed to the page. Before the commit a
+    timed-out or transiently failed idempotent request is retried, and a
+    slow one is hedged with a duplicate. Only idempotent requests without
+    a body wait for headers under a timeout: an upload or a slow POST
+    cannot be told apart from a dead server, and nor can a long poll.
+    """
+
+    def __init__(self, policy, operation, request, data, forward, host):
+        super(PolicyRequest, self).__init__(network_manager())
+        self.policy = policy
+        self.operation = operation
+        self.request = request
+        self.data = data
+        self.forward = forward
+        self.host = host
+        self.idempotent = operation in IDEMPOTENT and data is None
+        self.long_poll = policy.is_long_poll(request.url())
+        self.retries_left = policy.retries if self.idempotent else 0
+        self.attempts = {}
+        self.committed = None
+        self.hedged = False
+        self.started = False
+        self.closed = False
+
+        self.reply = ProxyReply(operation, request, network_manager())
+        self.reply.canceled.connect(self.cancel)
+
+        self.connect_timer = self.single_shot(self.connect_timed_out)
+        self.read_timer = self.single_shot(self.read_timed_out)
+        self.hedge_timer = self.single_shot(self.hedge)
+        self.retry_timer = self.single_shot(self.start_attempt)
+
+    def single_shot(self, slot):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(slot)
+        return timer
+
+    def start(self):
+        self.started = True
+        self.start_attempt()
+        threshold = self.policy.latency.threshold(self.host) if self.idempotent else None
+        if self.policy.hedging and threshold is not None and not self.long_poll:
+            self.hedge_timer.start(int(threshold * 1000))
+
+    def start_attempt(self):
+        if self.closed:
+            return
+        upstream = self.forward(self.operation, QNetworkRequest(self.request), self.data)
+        self.attempts[upstream] = time.monotonic()
+        upstream.metaDataChanged.connect(lambda: self.metadata(upstream))
+        upstream.readyRead.connect(lambda: self.ready_read(upstream))
+        upstream.finished.connect(lambda: self.attempt_finished(upstream))
+        if self.committed is None and self.idempotent and not self.long_poll:
+            self.connect_timer.start(self.policy.connect_timeout_ms)
+
+    def hedge(self):
+        if self.committed is None and not self.closed and not self.hedged:
+            self.hedged = True
+            metrics.inc("net_hedged_requests")
+            self.start_attempt()
+
+    def metadata(self, upstream):
+        if self.committed is not None or upstream not in self.attempts:
+            return
+        status, reason, headers = reply_metadata(upstream)
+        if status in RETRYABLE_STATUS and self.retries_left:
+            # Aborting a reply from its own metaDataChanged trips Qt; let the error body finish
+            del self.attempts[upstream]
+            upstream.finished.connect(upstream.deleteLater)
+            self.retry()
+            return
+
+        self.committed = upstream
+        started = self.attempts[upstream]
+        self.policy.latency.record(self.host, time.monotonic() - started)
+        metrics.observe("net_time_to_headers_seconds", time.monotonic() - started)
+        if self.hedged:
+            metrics.inc("net_hedge_wins", attempt="first" if started == min(self.attempts.values())
+                        else "hedge")
+        for other in list(self.attempts):
+            if other is not upstream:
+                self.drop(other)
+
+        self.connect_timer.stop()
+        self.hedge_timer.stop()
+        self.read_timer.start(self.policy.read_timeout_ms)
+        self.reply.upstream = upstream
+        self.reply.adopt(upstream)
+        self.reply.set_metadata(status, reason, headers)
+
+    def ready_read(self, upstream):
+        if upstream is self.committed and upstream in self.attempts:
+            self.read_timer.start(self.policy.read_timeout_ms)
+            self.reply.append(bytes(upstream.readAll()))
+
+    def attempt_finished(self, upstream):
+        if upstream not in self.attempts:
+            return  # dropped
+        if self.committed is None and upstream.attribute(QNetworkRequest.HttpStatusCodeAttribute):
+            self.metadata(upstream)
+            if upstream not in self.attempts:
+                return  # dropped for a retryable status
+        if upstream is not self.committed:
+            error = upstream.error()
+            self.drop(upstream)
+            if not self.attempts and not self.closed and not self.retry_timer.isActive():
+                if error in RETRYABLE_ERRORS and self.retries_left:
+                    self.retry()
+                else:
+                    self.fail(error, upstream.errorString())
+            return
+
+        self.ready_read(upstream)
+        self.attempts.pop(upstream)
+        upstream.deleteLater()
+        self.reply.upstream = None
+        self.reply.finish(upstream.error(), upstream.errorString())
+        self.close()
+
+    def connect_timed_out(self):
+        metrics.inc("net_request_timeouts", kind="connect")
+        for upstream in list(self.attempts):
+            self.drop(upstream)
+        if self.retries_left:
+            self.retry()
+        else:
+            self.fail(QNetworkReply.TimeoutError, "No response within %d ms"
+                      % self.policy.connect_timeout_ms)
+
+    def read_timed_out(self):
+        metrics.inc("net_request_timeouts", kind="read")
+        # Part of the body already reached the page, so it cannot be retried
+        for upstream in list(self.attempts):
+            self.drop(upstream)
+        self.fail(QNetworkReply.TimeoutError, "Response stalled for %d ms"
+                  % self.policy.read_timeout_ms)
+
+    def retry(self):
+        attempt = self.policy.retries - self.retries_left
+        self.retries_left -= 1
+        metrics.inc("net_request_retries")
+        self.retry_timer.start(self.policy.retry_backoff_ms * (2 ** attempt))
+
+    def drop(self, upstream):
+        # Its slots ignore replies that are no longer attempts
+        if self.attempts.pop(upstream, None) is None:
+            return
+        upstream.abort()
+        upstream.deleteLater()
+
+    def fail(self, error, message):
+        self.reply.upstream = None
+        self.reply.finish(error, message)
+        self.close()
+
+    def cancel(self):
+        for upstream in list(self.attempts):
+            self.drop(upstream)
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for timer in (self.connect_timer, self.read_timer, self.hedge_timer, self.retry_timer):
+            timer.stop()
+        if self.started:
+            self.policy.release(self.host)
+        self.deleteLater()
+
+
+class RequestPolicy(object):
+    """Request handler adding timeouts, retries, hedging and per-host caps.
+
+    Applies to http(s) requests only. At most host_limit requests per host
+    are handed to Qt at once so that timeouts measure the server, not a
+    queue inside QNetworkAccessManager; the rest wait here in FIFO order.
+    URLs matching a long_poll glob (query excluded) are never timed out
+    waiting for headers, nor hedged.
+    """
+
+    def __init__(self, connect_timeout_ms=5000, read_timeout_ms=15000, retries=2,
+                 retry_backoff_ms=200, hedging=True, hedge_percentile=95,
+                 hedge_floor_ms=50, host_limit=6, long_poll=()):
+        self.connect_timeout_ms = connect_timeout_ms
+        self.read_timeout_ms = read_timeout_ms
+        self.retries = retries
+        self.retry_backoff_ms = retry_backoff_ms
+        self.hedging = hedging
+        self.host_limit = host_limit
+        self.long_poll = list(long_poll)
+        self.latency = LatencyTracker(hedge_percentile, hedge_floor_ms / 1000.0)
+        self.active = collections.Counter()
+        self.queues = collections.defaultdict(collections.deque)
+
+    def is_long_poll(self, url):
+        address = url.toString(QUrl.RemoveQuery | QUrl.RemoveFragment)
+        return any(fnmatch.fnmatchcase(address, pattern) for pattern in self.long_poll)
+
+    def handle(self, operation, request, data, forward):
+        url = request.url()
+        if url.scheme() not in ("http", "https"):
+            return forward(operation, request, data)
+
+        host = "%s:%d" % (url.host(), url.port(443 if url.scheme() == "https" else 80))
+        pending = PolicyRequest(self, operation, request, data, forward, host)
+        if self.host_limit and self.active[host] >= self.host_limit:
+            self.queues[host].append(pending)
+            metrics.set("net_host_queue_depth", len(self.queues[host]), host=host)
+        else:
+            self.active[host] += 1
+            pending.start()
+        return pending.reply
+
+    def release(self, host):
+        queue = self.queues[host]
+        while queue:
+            pending = queue.popleft()
+            metrics.set("net_host_queue_depth", len(queue), host=host)
+            if not pending.closed:
+                pending.start()  # hand the slot straight over
+                return
+        self.active[host] -= 1
@@ -0,0 +1,92 @@
+import os
+from PyQt5.QtCore import QStandardPaths, QCoreApplication
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkCookieJar, QNetworkDiskCache
+
+from mappedcache import MappedDiskCache
+
+
+_network_manager = None
+
+
+def cache_directory():
+    base = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache", "supernova-surfer")
+    return os.path.join(base, "http")
+
+
+class NetworkManager(QNetworkAccessManager):
+    """QNetworkAccessManager that runs requests through a chain of handlers.
+
+    A handler is an object with handle(operation, request, data, forward).
+    It may return its own reply, or call forward() with the same arguments
+    to pass the request on to the next handler and finally to Qt. Handlers
+    are consulted in the order they were added.
+    """
+
+    def __init__(self, parent=None):
+        super(NetworkManager, self).__init__(parent)
+        self.handlers = []
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    def createRequest(self, operation, request, data=None):
+        return self.dispatch(0, operation, request, data)
+
+    def dispatch(self, position, operation, request, data=None):
+        if position == len(self.handlers):
+            return super(NetworkManager, self).createRequest(operation, request, data)
+
+        def forward(operation, request, data=None):
+            return self.dispatch(position + 1, operation, request, data)
+
+        return self.handlers[position].handle(operation, request, data, forward)
+
+
+def network_manager():
+    """Return the process-wide network manager shared by every tab.
+
+    Sharing a single QNetworkAccessManager gives all pages one connection
+    pool per host, one cookie jar and one HTTP cache, so a second tab on the
+    dashboard reuses warm keep-alive sockets and cached assets.
+    """
+    global _network_manager
+    if _network_manager is None:
+        # Parent to the application so no QWebPage takes ownership of it
+        manager = NetworkManager(QCoreApplication.instance())
+        manager.setCookieJar(QNetworkCookieJar(manager))
+        _network_manager = manager
+    return _network_manager
+
+
+DISK_CACHE_BACKENDS = ("mapped", "qt")
+
+
+def set_disk_cache_size(max_bytes, backend="mapped"):
+    """Cap the shared disk cache at max_bytes, or drop it entirely for 0.
+
+    The "mapped" backend packs every entry into a single preallocated file,
+    which suits SD cards far better than QNetworkDiskCache's file per entry.
+    """
+    manager = network_manager()
+    if max_bytes <= 0:
+        if manager.cache() is not None:
+            manager.cache().clear()
+        manager.setCache(None)
+        return
+
+    cache_class = MappedDiskCache if backend == "mapped" else QNetworkDiskCache
+    cache = manager.cache()
+    if type(cache) is not cache_class:
+        if cache_class is MappedDiskCache:
+            cache = MappedDiskCache(os.path.join(cache_directory(), "cache.pack"), max_bytes, manager)
+        else:
+            cache = QNetworkDiskCache(manager)
+            cache.setCacheDirectory(cache_directory())
+        manager.setCache(cache)
+    cache.setMaximumCacheSize(max_bytes)
+
+
+def attach_page(page):
+    page.setNetworkAccessManager(network_manager())
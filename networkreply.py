@@ -0,0 +1,176 @@
+from PyQt5.QtCore import QIODevice, QTimer, QUrl, pyqtSignal
+from PyQt5.QtNetwork import QNetworkReply, QNetworkRequest
+
+
+# Reply attributes QtWebKit reads besides the status line and headers
+FORWARDED_ATTRIBUTES = (
+    QNetworkRequest.RedirectionTargetAttribute,
+    QNetworkRequest.SourceIsFromCacheAttribute,
+    QNetworkRequest.ConnectionEncryptedAttribute,
+    QNetworkRequest.HttpPipeliningWasUsedAttribute,
+)
+
+
+class ProxyReply(QNetworkReply):
+    """A reply whose status, headers and body are fed in by Python code.
+
+    Request handlers return one of these to the page and fill it either from
+    an upstream reply (follow) or from stored data (serve). Observers passed
+    to follow() see the same metadata and chunks the page receives.
+    """
+
+    COMPACT_THRESHOLD = 256 * 1024
+
+    canceled = pyqtSignal()
+
+    def __init__(self, operation, request, parent=None):
+        super(ProxyReply, self).__init__(parent)
+        self.setRequest(request)
+        self.setUrl(request.url())
+        self.setOperation(operation)
+        self.buffer = bytearray()
+        self.offset = 0
+        self.received = 0
+        self.done = False
+        self.upstream = None
+        self.held = None
+        self.open(QIODevice.ReadOnly | QIODevice.Unbuffered)
+
+    def hold(self):
+        """Queue signals until release(), e.g. while the page has not connected yet."""
+        self.held = []
+
+    def release(self):
+        held, self.held = self.held or [], None
+        for signal, args in held:
+            signal.emit(*args)
+
+    def emit(self, signal, *args):
+        if self.held is not None:
+            self.held.append((signal, args))
+        else:
+            signal.emit(*args)
+
+    def adopt(self, upstream):
+        """Take over the reply attributes and TLS state of upstream before set_metadata."""
+        for attribute in FORWARDED_ATTRIBUTES:
+            value = upstream.attribute(attribute)
+            if value is not None:
+                self.setAttribute(attribute, value)
+        if upstream.url().scheme() == "https":
+            self.setSslConfiguration(upstream.sslConfiguration())
+
+    def set_metadata(self, status, reason, headers):
+        if status is not None:
+            self.setAttribute(QNetworkRequest.HttpStatusCodeAttribute, status)
+        if reason is not None:
+            self.setAttribute(QNetworkRequest.HttpReasonPhraseAttribute, reason)
+        for name, value in headers:
+            self.setRawHeader(name, value)
+        location = header_value(headers, b"location")
+        if (status is not None and 300 <= status < 400 and location is not None
+                and self.attribute(QNetworkRequest.RedirectionTargetAttribute) is None):
+            # Stored responses only have the header; WebKit follows the attribute
+            self.setAttribute(QNetworkRequest.RedirectionTargetAttribute,
+                              QUrl.fromEncoded(location))
+        self.emit(self.metaDataChanged)
+
+    def append(self, data):
+        if not data or self.done:
+            return
+        self.buffer += data
+        self.received += len(data)
+        self.emit(self.readyRead)
+        self.emit(self.downloadProgress, self.received, self.content_length())
+
+    def finish(self, error=QNetworkReply.NoError, message=""):
+        if self.done:
+            return
+        self.done = True
+        if error != QNetworkReply.NoError:
+            self.setError(error, message)
+            self.emit(self.error, error)
+        self.setFinished(True)
+        self.emit(self.finished)
+
+    def serve(self, status, reason, headers, body):
+        """Deliver a complete stored response on the next event-loop pass."""
+        def deliver():
+            if self.done:
+                return
+            self.set_metadata(status, reason, headers)
+            self.append(body)
+            self.finish()
+
+        QTimer.singleShot(0, deliver)
+
+    def follow(self, upstream, on_metadata=None, on_data=None, on_finished=None):
+        """Stream upstream into this reply, optionally tapping every stage."""
+        self.upstream = upstream
+
+        def metadata():
+            status, reason, headers = reply_metadata(upstream)
+            self.adopt(upstream)
+            self.set_metadata(status, reason, headers)
+            if on_metadata is not None:
+                on_metadata(status, reason, headers)
+
+        def data():
+            chunk = bytes(upstream.readAll())
+            if on_data is not None:
+                on_data(chunk)
+            self.append(chunk)
+
+        def finished():
+            data()
+            if on_finished is not None:
+                on_finished(upstream.error())
+            self.upstream = None
+            self.finish(upstream.error(), upstream.errorString())
+            upstream.deleteLater()
+
+        upstream.metaDataChanged.connect(metadata)
+        upstream.readyRead.connect(data)
+        upstream.finished.connect(finished)
+
+    def content_length(self):
+        length = self.header(QNetworkRequest.ContentLengthHeader)
+        return int(length) if length is not None else -1
+
+    def readData(self, maxlen):
+        chunk = bytes(self.buffer[self.offset:self.offset + maxlen])
+        self.offset += len(chunk)
+        if self.offset >= self.COMPACT_THRESHOLD:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        return chunk
+
+    def bytesAvailable(self):
+        return len(self.buffer) - self.offset + super(ProxyReply, self).bytesAvailable()
+
+    def isSequential(self):
+        return True
+
+    def abort(self):
+        if self.upstream is not None:
+            upstream, self.upstream = self.upstream, None
+            upstream.abort()
+        if not self.done:
+            self.canceled.emit()
+        self.finish(QNetworkReply.OperationCanceledError, "Operation canceled")
+
+
+def reply_metadata(reply):
+    """Return (status, reason, raw header pairs) of a reply as plain Python values."""
+    status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+    reason = reply.attribute(QNetworkRequest.HttpReasonPhraseAttribute)
+    headers = [(bytes(name), bytes(value)) for name, value in reply.rawHeaderPairs()]
+    return status, reason, headers
+
+
+def header_value(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
@@ -0,0 +1,103 @@
+import os
+import time
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtNetwork import QNetworkReply, QNetworkRequest
+
+from metrics import metrics
+from network import cache_directory, network_manager
+
+
+STARTING_PAGE = """<!DOCTYPE html>
+<html><head><title>Starting...</title></head>
+<body style="background:#111;color:#eee;font-family:sans-serif;text-align:center;padding-top:20%">
+<h1>Starting...</h1></body></html>
+"""
+
+
+class ReadinessProbe(QObject):
+    """Polls the backend with HEAD requests until it answers.
+
+    Attempts never block the event loop: each one is an asynchronous request
+    with its own timeout, retried with exponential backoff.
+    """
+
+    INITIAL_DELAY_MS = 100
+    MAX_DELAY_MS = 5000
+    ATTEMPT_TIMEOUT_MS = 2000
+
+    ready = pyqtSignal()
+
+    def __init__(self, url, parent=None):
+        super(ReadinessProbe, self).__init__(parent)
+        self.url = url
+        self.is_ready = False
+        self.delay = self.INITIAL_DELAY_MS
+        self.reply = None
+        self.started = time.monotonic()
+
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.attempt)
+
+        self.attempt_timer = QTimer(self)
+        self.attempt_timer.setSingleShot(True)
+        self.attempt_timer.timeout.connect(self.abort_attempt)
+
+    def start(self):
+        self.attempt()
+
+    def attempt(self):
+        metrics.inc("readiness_probe_attempts")
+        request = QNetworkRequest(self.url)
+        request.setAttribute(QNetworkRequest.CacheLoadControlAttribute, QNetworkRequest.AlwaysNetwork)
+        self.reply = network_manager().head(request)
+        self.reply.finished.connect(self.attempt_finished)
+        self.attempt_timer.start(self.ATTEMPT_TIMEOUT_MS)
+
+    def abort_attempt(self):
+        if self.reply is not None:
+            self.reply.abort()
+
+    def attempt_finished(self):
+        reply, self.reply = self.reply, None
+        self.attempt_timer.stop()
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        answered = reply.error() == QNetworkReply.NoError or (status is not None and status < 500)
+        reply.deleteLater()
+
+        if answered:
+            self.is_ready = True
+            metrics.set("backend_ready", 1)
+            metrics.observe("backend_ready_seconds", time.monotonic() - self.started,
+                            buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+            self.ready.emit()
+            return
+
+        metrics.set("backend_ready", 0)
+        self.retry_timer.start(self.delay)
+        self.delay = min(self.delay * 2, self.MAX_DELAY_MS)
+
+
+class HomeSnapshot(object):
+    """Last successfully rendered home page, shown while the backend boots."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(cache_directory()), "home-snapshot.html")
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as snapshot:
+                return snapshot.read()
+        except OSError:
+            return None
+
+    def save(self, html):
+        partial = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(partial, "w", encoding="utf-8") as snapshot:
+                snapshot.write(html)
+            os.replace(partial, self.path)
+        except OSError:
+            return False
+        return True
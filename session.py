@@ -0,0 +1,212 @@
+import json
+import os
+
+from PyQt5.QtCore import QObject, QPoint, QTimer, QUrl
+
+from metrics import metrics
+
+
+DEFAULT_SESSION_PATH = os.path.join(os.path.expanduser("~"), ".local", "share",
+                                    "supernova-surfer", "session.journal")
+
+
+class SessionState(object):
+    """Tabs described by a journal: ordered entries plus the active tab id."""
+
+    def __init__(self):
+        self.tabs = []
+        self.active = None
+
+    def find(self, tab_id):
+        for position, tab in enumerate(self.tabs):
+            if tab["id"] == tab_id:
+                return position
+        return -1
+
+    def apply(self, event):
+        op = event.get("op")
+        if op == "snapshot":
+            self.tabs = [dict(tab) for tab in event["tabs"]]
+            self.active = event.get("active")
+        elif op == "open":
+            tab = {"id": event["id"], "url": event["url"], "title": event.get("title", ""),
+                   "scroll": [0, 0]}
+            self.tabs.insert(min(event.get("index", len(self.tabs)), len(self.tabs)), tab)
+        elif op == "close":
+            position = self.find(event["id"])
+            if position >= 0:
+                del self.tabs[position]
+        elif op == "navigate":
+            position = self.find(event["id"])
+            if position >= 0:
+                self.tabs[position]["url"] = event["url"]
+                self.tabs[position]["title"] = event.get("title", "")
+        elif op == "move":
+            if 0 <= event["from"] < len(self.tabs):
+                tab = self.tabs.pop(event["from"])
+                self.tabs.insert(min(event["to"], len(self.tabs)), tab)
+        elif op == "activate":
+            self.active = event["id"]
+        elif op == "scroll":
+            position = self.find(event["id"])
+            if position >= 0:
+                self.tabs[position]["scroll"] = [event["x"], event["y"]]
+
+    def active_index(self):
+        position = self.find(self.active)
+        return position if position >= 0 else 0
+
+    def entries(self):
+        return [(QUrl(tab["url"]), tab["title"], QPoint(*tab["scroll"])) for tab in self.tabs]
+
+
+def read_journal(path):
+    """Replay the journal at path into a SessionState.
+
+    A crash can leave a torn last line; replay stops at the first line
+    that does not parse and keeps everything before it.
+    """
+    state = SessionState()
+    try:
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    state.apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    break
+    except OSError:
+        pass
+    return state
+
+
+class SessionJournal(QObject):
+    """Append-only log of tab events, fsynced in batches.
+
+    Events are buffered and written with a single fsync every
+    FLUSH_INTERVAL ms, so a burst of navigations costs one SD card write.
+    Once the journal grows past COMPACT_LINES it is rewritten as a single
+    snapshot of the current tabs.
+    """
+
+    FLUSH_INTERVAL = 2000
+    COMPACT_LINES = 500
+
+    def __init__(self, path=None, parent=None):
+        super(SessionJournal, self).__init__(parent)
+        self.path = path or DEFAULT_SESSION_PATH
+        self.registry = None
+        self.active = None
+        self.pending = []
+        self.lines = 0
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def read(self):
+        return read_journal(self.path)
+
+    def attach(self, registry):
+        """Start journaling registry's tabs from a freshly compacted snapshot."""
+        self.registry = registry
+        self.active = registry.current_record()
+        registry.tab_opened.connect(self.tab_opened)
+        registry.tab_closed.connect(self.tab_closed)
+        registry.tab_navigated.connect(self.tab_navigated)
+        registry.tab_moved.connect(self.tab_moved)
+        registry.tab_activated.connect(self.tab_activated)
+        self.compact()
+
+    def tab_opened(self, record, index):
+        self.append({"op": "open", "id": record.id, "index": index,
+                     "url": record.url.toString(), "title": record.title})
+
+    def tab_closed(self, record):
+        if record is self.active:
+            self.active = None
+        self.append({"op": "close", "id": record.id})
+
+    def tab_navigated(self, record):
+        self.append({"op": "navigate", "id": record.id,
+                     "url": record.url.toString(), "title": record.title})
+
+    def tab_moved(self, source, target):
+        self.append({"op": "move", "from": source, "to": target})
+
+    def tab_activated(self, record):
+        if self.active is not None and self.active is not record:
+            self.record_scroll(self.active)
+        self.active = record
+        self.append({"op": "activate", "id": record.id})
+
+    def record_scroll(self, record):
+        position = scroll_position(record)
+        self.append({"op": "scroll", "id": record.id, "x": position.x(), "y": position.y()})
+
+    def append(self, event):
+        self.pending.append(json.dumps(event, separators=(",", ":")))
+        if not self.flush_timer.isActive():
+            self.flush_timer.start(self.FLUSH_INTERVAL)
+
+    def flush(self):
+        self.flush_timer.stop()
+        if not self.pending:
+            return
+        if self.lines + len(self.pending) > self.COMPACT_LINES and self.registry is not None:
+            self.compact()
+            return
+
+        data = "".join(line + "\n" for line in self.pending)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as journal:
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+        except OSError:
+            metrics.inc("session_journal_errors")
+            return
+        self.lines += len(self.pending)
+        metrics.inc("session_journal_syncs")
+        metrics.inc("session_journal_events", len(self.pending))
+        self.pending = []
+
+    def snapshot(self):
+        registry = self.registry
+        tabs = []
+        for index in range(registry.tabs.count()):
+            record = registry.record_at(index)
+            position = scroll_position(record)
+            tabs.append({"id": record.id, "url": record.url.toString(), "title": record.title,
+                         "scroll": [position.x(), position.y()]})
+        current = registry.current_record()
+        return {"op": "snapshot", "tabs": tabs, "active": current.id if current else None}
+
+    def compact(self):
+        """Replace the journal with one snapshot line describing the open tabs."""
+        self.flush_timer.stop()
+        partial = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(partial, "w", encoding="utf-8") as journal:
+                journal.write(json.dumps(self.snapshot(), separators=(",", ":")) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(partial, self.path)
+        except OSError:
+            metrics.inc("session_journal_errors")
+            return
+        self.pending = []
+        self.lines = 1
+        metrics.inc("session_journal_compactions")
+
+    def close(self):
+        if self.active is not None:
+            self.record_scroll(self.active)
+        self.flush()
+
+
+def scroll_position(record):
+    if record.view is not None:
+        return record.view.page().mainFrame().scrollPosition()
+    return QPoint(record.scroll_position)
@@ -0,0 +1,60 @@
+import json
+import time
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+
+class StartupTrace(QObject):
+    """Records when each cold-start phase finished and writes them as JSON.
+
+    Times are milliseconds since origin, normally taken at the very top of
+    main.py. The trace is written once both the first paint and the home
+    page's loadFinished have been seen, or after a timeout.
+    """
+
+    TIMEOUT_MS = 60000
+    FINAL_PHASES = ("first_paint", "home_load_finished")
+
+    def __init__(self, path=None, origin=None, parent=None):
+        super(StartupTrace, self).__init__(parent)
+        self.path = path
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.phases = []
+        self.window = None
+        self.written = False
+
+    def mark(self, name, when=None):
+        when = when if when is not None else time.perf_counter()
+        self.phases.append((name, (when - self.origin) * 1000.0))
+        if all(self.seen(phase) for phase in self.FINAL_PHASES):
+            self.write()
+
+    def seen(self, name):
+        return any(phase == name for phase, _ in self.phases)
+
+    def watch_first_paint(self, window):
+        self.window = window
+        QApplication.instance().installEventFilter(self)
+        QTimer.singleShot(self.TIMEOUT_MS, self.write)
+
+    def watch_home_load(self, view):
+        def finished(ok):
+            view.loadFinished.disconnect(finished)
+            self.mark("home_load_finished")
+
+        view.loadFinished.connect(finished)
+
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.Paint and obj.isWidgetType()
+                and obj.window() is self.window):
+            QApplication.instance().removeEventFilter(self)
+            self.mark("first_paint")
+        return False
+
+    def write(self):
+        if self.written or not self.path:
+            return
+        self.written = True
+        with open(self.path, "w") as trace:
+            json.dump({"phases": [{"name": name, "ms": round(ms, 3)} for name, ms in self.phases]},
+                      trace, indent=2)
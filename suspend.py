@@ -0,0 +1,133 @@
+from PyQt5.QtWebKitWidgets import QWebPage
+
+
+RUNNING = 0
+PAUSED = -1
+
+THROTTLE_PROPERTY = "supernovaThrottle"
+HIDDEN_PROPERTY = "supernovaHidden"
+
+# Installed into every frame before the page's own scripts run. Timers,
+# intervals and animation frames are routed through a gate so they can be
+# clamped to a minimum period, or held back entirely while paused.
+SHIM = r"""
+(function (w) {
+    if (w.__supernovaThrottle) return;
+    var state = w.__supernovaThrottle = {period: 0, waiting: []};
+    var setT = w.setTimeout, clearT = w.clearTimeout, setI = w.setInterval;
+    var raf = w.requestAnimationFrame || w.webkitRequestAnimationFrame;
+    var caf = w.cancelAnimationFrame || w.webkitCancelAnimationFrame;
+    var slice = Array.prototype.slice;
+
+    w.setTimeout = function (fn, delay) {
+        if (typeof fn !== "function") return setT.apply(w, arguments);
+        var args = slice.call(arguments, 2), id;
+        id = setT.call(w, function () {
+            if (state.period < 0) state.waiting.push([id, fn, args]);
+            else fn.apply(w, args);
+        }, state.period > 0 ? Math.max(delay || 0, state.period) : delay);
+        return id;
+    };
+    w.clearTimeout = function (id) {
+        for (var i = 0; i < state.waiting.length; i++) {
+            if (state.waiting[i][0] === id) state.waiting.splice(i--, 1);
+        }
+        return clearT.call(w, id);
+    };
+    w.setInterval = function (fn, delay) {
+        if (typeof fn !== "function") return setI.apply(w, arguments);
+        var args = slice.call(arguments, 2), last = 0;
+        return setI.call(w, function () {
+            var now = Date.now();
+            if (state.period < 0 || (state.period > 0 && now - last < state.period)) return;
+            last = now;
+            fn.apply(w, args);
+        }, delay);
+    };
+    if (raf) {
+        w.requestAnimationFrame = w.webkitRequestAnimationFrame = function (cb) {
+            if (!state.period) return raf.call(w, cb);
+            return -w.setTimeout(function () { raf.call(w, cb); }, state.period > 0 ? state.period : 0);
+        };
+        w.cancelAnimationFrame = w.webkitCancelAnimationFrame = function (id) {
+            return id < 0 ? w.clearTimeout(-id) : caf.call(w, id);
+        };
+    }
+
+    state.set = function (period) {
+        state.period = period;
+        var style = w.document.getElementById("__supernova_paused");
+        if (period < 0 && !style && w.document.documentElement) {
+            style = w.document.createElement("style");
+            style.id = "__supernova_paused";
+            style.textContent = "*, *::before, *::after { -webkit-animation-play-state: paused !important;" +
+                                " animation-play-state: paused !important; }";
+            w.document.documentElement.appendChild(style);
+        } else if (period >= 0 && style) {
+            style.parentNode.removeChild(style);
+        }
+        if (period >= 0) {
+            var waiting = state.waiting;
+            state.waiting = [];
+            for (var i = 0; i < waiting.length; i++) {
+                setT.call(w, (function (job) {
+                    return function () { job[1].apply(w, job[2]); };
+                })(waiting[i]), 0);
+            }
+        }
+    };
+})(window);
+"""
+
+
+def frames(frame):
+    yield frame
+    for child in frame.childFrames():
+        yield from frames(child)
+
+
+def page_throttle(page):
+    period = page.property(THROTTLE_PROPERTY)
+    return period if period is not None else RUNNING
+
+
+def page_state(page):
+    """Return the (period, hidden) pair last applied to page."""
+    return page_throttle(page), bool(page.property(HIDDEN_PROPERTY))
+
+
+def install_shim(page, frame):
+    frame.evaluateJavaScript(SHIM)
+    period = page_throttle(page)
+    if period != RUNNING:
+        frame.evaluateJavaScript("window.__supernovaThrottle.set(%d)" % period)
+
+
+def watch_page(page):
+    """Install the timer shim into every document the page loads."""
+    def watch_frame(frame):
+        frame.javaScriptWindowObjectCleared.connect(lambda: install_shim(page, frame))
+
+    watch_frame(page.mainFrame())
+    page.frameCreated.connect(watch_frame)
+
+
+def set_page_throttle(page, period, hidden=None):
+    """Clamp the page's timers to period ms, pause them (PAUSED) or lift the clamp.
+
+    hidden sets the page's visibility state where QtWebKit supports it,
+    which also stops WebKit's own animation timers; it defaults to hiding
+    paused pages only.
+    """
+    if hidden is None:
+        hidden = period == PAUSED
+    if page_throttle(page) != period:
+        page.setProperty(THROTTLE_PROPERTY, period)
+        for frame in frames(page.mainFrame()):
+            frame.evaluateJavaScript(
+                "window.__supernovaThrottle && window.__supernovaThrottle.set(%d)" % period)
+    if bool(page.property(HIDDEN_PROPERTY)) != hidden:
+        page.setProperty(HIDDEN_PROPERTY, hidden)
+        if hasattr(page, "setVisibilityState"):
+            page.setVisibilityState(QWebPage.VisibilityStateHidden if hidden
+                                    else QWebPage.VisibilityStateVisible)
@@ -0,0 +1,176 @@
+import fnmatch
+import time
+from collections import OrderedDict, namedtuple
+from PyQt5.QtCore import QUrl
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from metrics import metrics
+from network import network_manager
+from networkreply import ProxyReply, header_value
+
+
+SwrRule = namedtuple("SwrRule", ["pattern", "max_age", "stale"])
+
+# Headers that describe the original transfer rather than the stored body
+TRANSFER_HEADERS = {b"transfer-encoding", b"content-encoding", b"content-length",
+                    b"connection", b"keep-alive"}
+
+
+def parse_swr_rules(rules):
+    """Build SwrRules from (pattern, [max_age, stale]) pairs, in seconds."""
+    return [SwrRule(pattern, float(values[0]), float(values[1])) for pattern, values in rules]
+
+
+class CacheEntry(object):
+    __slots__ = ("status", "reason", "headers", "body", "stored_at")
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = [(name, value) for name, value in headers
+                        if name.lower() not in TRANSFER_HEADERS]
+        self.headers.append((b"Content-Length", str(len(body)).encode()))
+        self.body = body
+        self.stored_at = time.monotonic()
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class LruStore(object):
+    """Size-bounded map of URL to CacheEntry, evicting least recently used first."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.pop(key)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            metrics.inc("http_cache_evictions")
+        metrics.set("http_cache_bytes", self.size)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+        return entry
+
+
+class StaleWhileRevalidate(object):
+    """Request handler serving matching GETs from memory and revalidating behind.
+
+    Within max_age an entry is served as is; within the following stale
+    window it is still served immediately while a conditional request
+    (If-None-Match / If-Modified-Since) refreshes it in the background.
+    Older entries, and URLs without a matching rule, go to the network.
+    """
+
+    def __init__(self, rules, max_bytes):
+        self.rules = rules
+        self.store = LruStore(max_bytes)
+        self.revalidating = set()
+
+    def rule_for(self, url):
+        address = url.toString(QUrl.RemoveQuery | QUrl.RemoveFragment)
+        for rule in self.rules:
+            if fnmatch.fnmatchcase(address, rule.pattern):
+                return rule
+        return None
+
+    def handle(self, operation, request, data, forward):
+        if operation != QNetworkAccessManager.GetOperation:
+            return forward(operation, request, data)
+        rule = self.rule_for(request.url())
+        if rule is None:
+            return forward(operation, request, data)
+
+        key = request.url().toString(QUrl.RemoveFragment)
+        entry = self.store.get(key)
+        age = time.monotonic() - entry.stored_at if entry is not None else None
+
+        if entry is None or age > rule.max_age + rule.stale:
+            metrics.inc("http_cache_requests", result="miss" if entry is None else "expired")
+            return self.fetch(key, operation, request, data, forward)
+
+        if age > rule.max_age:
+            metrics.inc("http_cache_requests", result="stale")
+            self.revalidate(key, request, entry, forward)
+        else:
+            metrics.inc("http_cache_requests", result="fresh")
+
+        reply = ProxyReply(operation, request, network_manager())
+        reply.serve(entry.status, entry.reason, entry.headers, entry.body)
+        return reply
+
+    def fetch(self, key, operation, request, data, forward):
+        reply = ProxyReply(operation, request, network_manager())
+        captured = {"chunks": []}
+
+        def on_metadata(status, reason, headers):
+            captured.update(status=status, reason=reason, headers=headers)
+
+        def on_finished(error):
+            if error == QNetworkReply.NoError and self.storable(captured):
+                entry = CacheEntry(captured["status"], captured["reason"], captured["headers"],
+                                   b"".join(captured["chunks"]))
+                self.store.put(key, entry)
+
+        reply.follow(forward(operation, request, data), on_metadata,
+                     captured["chunks"].append, on_finished)
+        return reply
+
+    @staticmethod
+    def storable(captured):
+        if captured.get("status") != 200:
+            return False
+        cache_control = header_value(captured["headers"], b"cache-control") or b""
+        return b"no-store" not in cache_control.lower()
+
+    def revalidate(self, key, request, entry, forward):
+        if key in self.revalidating:
+            return
+        self.revalidating.add(key)
+
+        conditional = QNetworkRequest(request)
+        conditional.setAttribute(QNetworkRequest.CacheLoadControlAttribute,
+                                 QNetworkRequest.AlwaysNetwork)
+        etag = header_value(entry.headers, b"etag")
+        last_modified = header_value(entry.headers, b"last-modified")
+        if etag is not None:
+            conditional.setRawHeader(b"If-None-Match", etag)
+        if last_modified is not None:
+            conditional.setRawHeader(b"If-Modified-Since", last_modified)
+
+        upstream = forward(QNetworkAccessManager.GetOperation, conditional, None)
+
+        def finished():
+            self.revalidating.discard(key)
+            status = upstream.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+            if status == 304:
+                entry.stored_at = time.monotonic()
+                metrics.inc("http_cache_revalidations", result="not_modified")
+            elif status == 200 and upstream.error() == QNetworkReply.NoError:
+                headers = [(bytes(name), bytes(value)) for name, value in upstream.rawHeaderPairs()]
+                reason = upstream.attribute(QNetworkRequest.HttpReasonPhraseAttribute)
+                self.store.put(key, CacheEntry(status, reason, headers, bytes(upstream.readAll())))
+                metrics.inc("http_cache_revalidations", result="updated")
+            else:
+                metrics.inc("http_cache_revalidations", result="failed")
+            upstream.deleteLater()
+
+        upstream.finished.connect(finished)
@@ -0,0 +1,347 @@
+import itertools
+import time
+from PyQt5.QtCore import QObject, QPoint, QTimer, QUrl, Qt, pyqtSignal
+from PyQt5.QtWidgets import QLabel, QVBoxLayout, QWidget
+
+from memory import resident_set_size
+from metrics import metrics
+
+
+UNLOADED = "unloaded"
+LOADING = "loading"
+LOADED = "loaded"
+FAILED = "failed"
+DISCARDED = "discarded"
+
+PAGE_LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+VIEW_SIGNALS = ("titleChanged", "urlChanged", "loadStarted", "loadProgress",
+                "loadFinished", "iconChanged", "linkClicked", "selectionChanged",
+                "statusBarMessage")
+
+
+def disconnect_all(signal):
+    try:
+        signal.disconnect()
+    except TypeError:
+        pass  # nothing was connected
+
+
+def teardown_view(view):
+    """Release a QWebView and everything it keeps alive, deterministically.
+
+    Stops the load, drops every signal connection (and so the lambdas that
+    close over the view), empties the page and schedules both page and view
+    for deletion instead of leaving them to the garbage collector.
+    """
+    view.stop()
+    for name in VIEW_SIGNALS:
+        disconnect_all(getattr(view, name))
+
+    page = view.page()
+    page.history().clear()
+    page.mainFrame().setHtml("")
+
+    view.setParent(None)
+    page.deleteLater()
+    view.deleteLater()
+
+
+class TabRecord(object):
+    """Lightweight state kept for every tab, whether or not its view is alive."""
+
+    __slots__ = ("id", "url", "title", "load_state", "bytes_received", "scroll_position",
+                 "throttle", "thumbnail", "last_active", "load_started_at", "host", "view")
+
+    ids = itertools.count(1)
+
+    def __init__(self, url, title="New Tab"):
+        self.id = next(self.ids)
+        self.url = url
+        self.title = title
+        self.load_state = UNLOADED
+        self.bytes_received = 0
+        self.scroll_position = QPoint()
+        self.throttle = None
+        self.thumbnail = None
+        self.last_active = 0.0
+        self.load_started_at = None
+        self.host = None
+        self.view = None
+
+
+class TabHost(QWidget):
+    """Stable tab page that holds either a live view or a discarded-tab placeholder."""
+
+    def __init__(self, record):
+        super(TabHost, self).__init__()
+        self.record = record
+        self.placeholder = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def set_view(self, view):
+        self.clear_placeholder()
+        self.layout().addWidget(view)
+
+    def show_placeholder(self, thumbnail):
+        self.clear_placeholder()
+        self.placeholder = QLabel(self.record.title)
+        self.placeholder.setAlignment(Qt.AlignCenter)
+        if thumbnail is not None:
+            self.placeholder.setPixmap(thumbnail)
+        self.layout().addWidget(self.placeholder)
+
+    def clear_placeholder(self):
+        if self.placeholder is not None:
+            self.placeholder.deleteLater()
+            self.placeholder = None
+
+
+class TabRegistry(QObject):
+    """Single source of truth for tabs, their records and their live views.
+
+    Records are reachable in O(1) from their tab page or their view; tab
+    indices are cached and only recomputed after tabs are added, removed or
+    moved. Title and URL changes are coalesced and applied once per
+    event-loop tick.
+
+    Views are only built when a tab is activated. While RSS is above the
+    memory budget the least recently used background view is discarded,
+    leaving its record and a thumbnail behind to rebuild from later.
+    """
+
+    CHECK_INTERVAL_MS = 5000
+    THUMBNAIL_WIDTH = 480
+
+    current_url_changed = pyqtSignal(QUrl)
+    tab_opened = pyqtSignal(object, int)
+    tab_closed = pyqtSignal(object)
+    tab_moved = pyqtSignal(int, int)
+    tab_navigated = pyqtSignal(object)
+    tab_activated = pyqtSignal(object)
+
+    def __init__(self, tabs, view_pool, load_scheduler, view_connector, memory_budget=0,
+                 parent=None):
+        super(TabRegistry, self).__init__(parent)
+        self.tabs = tabs
+        self.view_pool = view_pool
+        self.load_scheduler = load_scheduler
+        self.view_connector = view_connector
+        self.memory_budget = memory_budget
+        self.records = {}
+        self.views = {}
+        self.indices = None
+        self.dirty = set()
+        self.manual_loads = set()
+        self.suspended = False
+        self.discards = 0
+
+        self.tabs.currentChanged.connect(self.activate)
+        self.tabs.tabBar().tabMoved.connect(self.invalidate_indices)
+        self.tabs.tabBar().tabMoved.connect(self.tab_moved)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+
+        self.budget_timer = QTimer(self)
+        self.budget_timer.timeout.connect(self.check_memory_budget)
+        if memory_budget:
+            self.budget_timer.start(self.CHECK_INTERVAL_MS)
+
+    def add(self, url, title="New Tab", background=False, load=True):
+        """Add a tab; with load=False the caller fills the new view itself."""
+        record = TabRecord(url, title)
+        record.host = TabHost(record)
+        self.records[record.host] = record
+        metrics.set("tabs_open", len(self.records))
+        if not load:
+            self.manual_loads.add(record)
+
+        # Activation, and with it instantiation, follows from currentChanged
+        self.tab_opened.emit(record, self.tabs.count())
+        index = self.tabs.addTab(record.host, title)
+        self.invalidate_indices()
+        if not background:
+            self.tabs.setCurrentIndex(index)
+        return record
+
+    def restore(self, entries, active_index, load=True):
+        """Recreate tabs from (url, title, scroll position) entries and return their records.
+
+        Only the active tab gets a view; the others stay lightweight
+        records until they are activated. With load=False no restored tab
+        loads until start_manual_load() is called for it.
+        """
+        records = []
+        self.suspended = True
+        try:
+            for url, title, scroll_position in entries:
+                record = self.add(url, title, background=True, load=load)
+                record.scroll_position = scroll_position
+                records.append(record)
+        finally:
+            self.suspended = False
+
+        active_index = min(max(active_index, 0), self.tabs.count() - 1)
+        if self.tabs.currentIndex() == active_index:
+            self.activate(active_index)
+        else:
+            self.tabs.setCurrentIndex(active_index)
+        return records
+
+    def start_manual_load(self, record):
+        """Load a tab added with load=False, now or whenever it is first shown."""
+        self.manual_loads.discard(record)
+        if record.view is not None:
+            self.load_scheduler.load(record)
+
+    def remove(self, index):
+        host = self.tabs.widget(index)
+        record = self.records.pop(host, None)
+        metrics.set("tabs_open", len(self.records))
+        self.tabs.removeTab(index)
+        self.invalidate_indices()
+        if record is not None:
+            self.dirty.discard(record)
+            self.manual_loads.discard(record)
+            if record.view is not None:
+                self.release_view(record)
+            self.tab_closed.emit(record)
+        host.deleteLater()
+
+    def invalidate_indices(self, *args):
+        self.indices = None
+
+    def index_of(self, record):
+        if self.indices is None:
+            self.indices = {self.tabs.widget(i): i for i in range(self.tabs.count())}
+        return self.indices.get(record.host, -1)
+
+    def record_at(self, index):
+        return self.records.get(self.tabs.widget(index))
+
+    def record_for_view(self, view):
+        return self.views.get(view)
+
+    def current_record(self):
+        return self.records.get(self.tabs.currentWidget())
+
+    def is_current(self, record):
+        return record.host is self.tabs.currentWidget()
+
+    def current_view(self):
+        record = self.current_record()
+        return record.view if record is not None else None
+
+    def activate(self, index):
+        record = self.record_at(index)
+        if record is None or self.suspended:
+            return
+        record.last_active = time.monotonic()
+        if record.view is None:
+            self.instantiate(record)
+        else:
+            self.load_scheduler.promote(record)
+        self.current_url_changed.emit(record.url)
+        self.tab_activated.emit(record)
+
+    def instantiate(self, record):
+        load = record not in self.manual_loads
+        self.manual_loads.discard(record)
+        view, warm = self.view_pool.acquire(record.url, load and record.scroll_position.isNull())
+        view.urlChanged.connect(lambda url: self.url_changed(record, url))
+        view.titleChanged.connect(lambda title: self.title_changed(record, title))
+        view.loadStarted.connect(lambda: self.load_started(record))
+        view.loadFinished.connect(lambda ok: self.load_finished(record, ok))
+
+        if not record.scroll_position.isNull():
+            position = QPoint(record.scroll_position)
+
+            def restore_scroll(ok):
+                view.loadFinished.disconnect(restore_scroll)
+                view.page().mainFrame().setScrollPosition(position)
+
+            view.loadFinished.connect(restore_scroll)
+
+        record.view = view
+        self.views[view] = record
+        metrics.set("tab_views_live", len(self.views))
+        record.host.set_view(view)
+        if warm:
+            record.url = view.url()
+            record.title = view.title() or record.title
+            record.load_state = LOADED
+            self.mark_dirty(record)
+        self.view_connector(view, record)
+        if load and not warm:
+            self.load_scheduler.load(record)
+
+    def url_changed(self, record, url):
+        record.url = url
+        self.mark_dirty(record)
+
+    def title_changed(self, record, title):
+        record.title = title
+        self.mark_dirty(record)
+
+    def load_started(self, record):
+        record.load_state = LOADING
+        record.load_started_at = time.monotonic()
+
+    def load_finished(self, record, ok):
+        record.load_state = LOADED if ok else FAILED
+        record.bytes_received = record.view.page().bytesReceived()
+        origin = record.view.url().adjusted(QUrl.RemovePath | QUrl.RemoveQuery |
+                                            QUrl.RemoveFragment | QUrl.RemoveUserInfo).toString()
+        metrics.inc("page_bytes_received", record.bytes_received, origin=origin)
+        if record.load_started_at is not None:
+            metrics.observe("page_load_seconds", time.monotonic() - record.load_started_at,
+                            PAGE_LOAD_BUCKETS, origin=origin, ok=str(bool(ok)).lower())
+            record.load_started_at = None
+
+    def mark_dirty(self, record):
+        self.dirty.add(record)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start(0)
+
+    def flush(self):
+        current = self.current_record()
+        for record in self.dirty:
+            index = self.index_of(record)
+            if index >= 0:
+                self.tabs.setTabText(index, record.title if record.title else "Loading...")
+            if record is current:
+                self.current_url_changed.emit(record.url)
+            self.tab_navigated.emit(record)
+        self.dirty.clear()
+
+    def discard(self, record):
+        view = record.view
+        if not view.url().isEmpty():
+            record.url = view.url()
+        record.scroll_position = view.page().mainFrame().scrollPosition()
+        record.thumbnail = view.grab().scaledToWidth(self.THUMBNAIL_WIDTH, Qt.SmoothTransformation)
+
+        self.release_view(record)
+        record.load_state = DISCARDED
+        record.host.show_placeholder(record.thumbnail)
+        self.discards += 1
+
+    def release_view(self, record):
+        self.load_scheduler.cancel(record)
+        view = record.view
+        record.view = None
+        self.views.pop(view, None)
+        metrics.set("tab_views_live", len(self.views))
+        teardown_view(view)
+
+    def check_memory_budget(self):
+        if resident_set_size() <= self.memory_budget:
+            return
+        current = self.tabs.currentWidget()
+        candidates = [record for record in self.records.values()
+                      if record.view is not None and record.host is not current]
+        if candidates:
+            self.discard(min(candidates, key=lambda record: record.last_active))
@@ -0,0 +1,88 @@
+"""Asset pack loading and the replies served out of it.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QUrl
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+
+from assetpack import AssetPack, AssetSchemeHandler, build_pack
+
+
+def wait_until(condition, timeout_ms=2000):
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+    return condition()
+
+
+class AssetPackTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="supernova-assets-test-")
+        source = os.path.join(self.directory, "assets")
+        os.makedirs(os.path.join(source, "css"))
+        with open(os.path.join(source, "css", "site.css"), "wb") as asset:
+            asset.write(b"body { margin: 0 }")
+        self.path = os.path.join(self.directory, "assets.pack")
+        build_pack(source, self.path)
+        self.handler = AssetSchemeHandler(AssetPack(self.path))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, path):
+        request = QNetworkRequest(QUrl("supernova://assets/" + path))
+        return self.handler.handle(QNetworkAccessManager.GetOperation, request, None, None)
+
+    def test_serves_packed_file(self):
+        reply = self.get("css/site.css")
+        self.assertTrue(wait_until(reply.isFinished))
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(reply.attribute(QNetworkRequest.HttpStatusCodeAttribute), 200)
+        self.assertEqual(reply.header(QNetworkRequest.ContentTypeHeader), "text/css")
+        self.assertEqual(bytes(reply.readAll()), b"body { margin: 0 }")
+
+    def test_missing_asset_is_not_found(self):
+        reply = self.get("css/missing.css")
+        self.assertTrue(wait_until(reply.isFinished))
+        self.assertEqual(reply.error(), QNetworkReply.ContentNotFoundError)
+
+    def test_abort_cancels_before_delivery(self):
+        reply = self.get("css/site.css")
+        finished = []
+        reply.finished.connect(lambda: finished.append(reply.error()))
+        reply.abort()
+        reply.abort()
+
+        self.assertTrue(reply.isFinished())
+        self.assertEqual(finished, [QNetworkReply.OperationCanceledError])
+        # The queued delivery must not report the reply a second time
+        wait_until(lambda: len(finished) > 1, 100)
+        self.assertEqual(finished, [QNetworkReply.OperationCanceledError])
+
+    def test_empty_or_foreign_file_is_refused(self):
+        empty = os.path.join(self.directory, "empty.pack")
+        open(empty, "wb").close()
+        foreign = os.path.join(self.directory, "foreign.pack")
+        with open(foreign, "wb") as pack:
+            pack.write(b"not an asset pack at all")
+        for path in (empty, foreign):
+            with self.assertRaises(ValueError):
+                AssetPack(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
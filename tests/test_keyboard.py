@@ -0,0 +1,151 @@
+"""Keyboard control over the local socket channel, against a stand-in keyboard.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+from benchmarks.standin import StandinKeyboard
+from keyboard import (DBusChannel, KeyboardManager, LocalSocketChannel, QDBusConnection,
+                      default_channel)
+from metrics import metrics
+
+
+def wait_until(condition, timeout_ms=2000):
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+    return condition()
+
+
+class LocalSocketChannelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.name = "supernova-keyboard-test-%d" % os.getpid()
+        self.keyboard = None
+        self.replies = []
+
+    def tearDown(self):
+        if self.keyboard is not None:
+            self.keyboard.stop()
+
+    def start_keyboard(self, silent=False):
+        self.keyboard = StandinKeyboard(self.name, silent).start()
+        return self.keyboard
+
+    def test_commands_sent_while_connecting_are_delivered(self):
+        keyboard = self.start_keyboard()
+        channel = LocalSocketChannel(self.name)
+        channel.send("show", self.replies.append)
+        channel.send("hide", self.replies.append)
+
+        self.assertTrue(wait_until(lambda: len(self.replies) == 2))
+        self.assertEqual(self.replies, [True, True])
+        self.assertEqual(keyboard.commands, ["show", "hide"])
+        self.assertEqual(channel.pending, [])
+
+    def test_error_reply_fails_the_command(self):
+        self.start_keyboard()
+        channel = LocalSocketChannel(self.name)
+        channel.send("wiggle", self.replies.append)
+        self.assertTrue(wait_until(lambda: self.replies))
+        self.assertEqual(self.replies, [False])
+
+    def test_no_server_fails_instead_of_queueing(self):
+        channel = LocalSocketChannel(self.name)
+        self.assertFalse(channel.available())
+        channel.send("show", self.replies.append)
+
+        self.assertTrue(wait_until(lambda: self.replies))
+        self.assertEqual(self.replies, [False])
+        self.assertEqual(channel.outbox, [])
+        self.assertEqual(channel.pending, [])
+
+    def test_disconnect_fails_unanswered_commands(self):
+        keyboard = self.start_keyboard(silent=True)
+        channel = LocalSocketChannel(self.name)
+        channel.send("show", self.replies.append)
+        self.assertTrue(wait_until(lambda: keyboard.commands))
+        self.assertEqual(self.replies, [])
+
+        keyboard.stop()
+        self.assertTrue(wait_until(lambda: self.replies))
+        self.assertEqual(self.replies, [False])
+        self.assertEqual(channel.pending, [])
+
+    def test_reconnects_after_the_keyboard_restarts(self):
+        keyboard = self.start_keyboard()
+        channel = LocalSocketChannel(self.name)
+        channel.send("show", self.replies.append)
+        self.assertTrue(wait_until(lambda: self.replies))
+        keyboard.stop()
+        self.assertTrue(wait_until(
+            lambda: channel.socket.state() == channel.socket.UnconnectedState))
+
+        keyboard = self.start_keyboard()
+        channel.send("hide", self.replies.append)
+        self.assertTrue(wait_until(lambda: len(self.replies) == 2))
+        self.assertEqual(self.replies, [True, True])
+        self.assertEqual(keyboard.commands, ["hide"])
+
+
+class KeyboardManagerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.name = "supernova-keyboard-manager-test-%d" % os.getpid()
+        self.keyboard = StandinKeyboard(self.name).start()
+        self.manager = KeyboardManager(program="/nonexistent/onboard",
+                                       channel=LocalSocketChannel(self.name))
+
+    def tearDown(self):
+        self.manager.shutdown()
+        self.keyboard.stop()
+
+    def test_show_and_debounced_hide(self):
+        self.manager.show()
+        self.assertTrue(wait_until(lambda: self.keyboard.visible))
+        self.manager.hide()
+        self.manager.show()
+        self.manager.hide()
+        self.assertTrue(wait_until(lambda: not self.keyboard.visible))
+        self.assertEqual(self.keyboard.commands, ["show", "hide"])
+        self.assertEqual(self.manager.process.state(), self.manager.process.NotRunning)
+
+    def test_failed_start_does_not_block(self):
+        self.keyboard.stop()
+        errors = metrics.value("keyboard_process_errors")
+        started = time.monotonic()
+        self.manager.show()
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertTrue(wait_until(lambda: metrics.value("keyboard_process_errors") > errors))
+        self.assertFalse(self.manager.visible)
+
+
+@unittest.skipIf(QDBusConnection is None, "QtDBus is not available")
+class DBusChannelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def test_missing_session_bus_is_unavailable(self):
+        if QDBusConnection.sessionBus().isConnected():
+            self.skipTest("a session bus is running")
+        self.assertIsNone(default_channel("dbus"))
+        self.assertFalse(DBusChannel().available())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""On-disk format of the memory-mapped pack cache.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QDateTime, QUrl
+from PyQt5.QtNetwork import QNetworkCacheMetaData
+
+from mappedcache import HEADER, HEADER_SIZE, RECORD, MappedDiskCache
+from metrics import metrics
+
+
+CAPACITY = 64 * 1024
+
+
+def metadata_for(url, etag=b"v1"):
+    metadata = QNetworkCacheMetaData()
+    metadata.setUrl(url)
+    metadata.setSaveToDisk(True)
+    metadata.setRawHeaders([(b"Content-Type", b"text/plain"), (b"ETag", etag)])
+    metadata.setExpirationDate(QDateTime.currentDateTimeUtc().addSecs(3600))
+    return metadata
+
+
+def url_for(name):
+    return QUrl("http://127.0.0.1:8005/%s" % name)
+
+
+class MappedDiskCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="supernova-cache-test-")
+        self.path = os.path.join(self.directory, "cache.pack")
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.deleteLater()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open_cache(self, capacity=CAPACITY):
+        cache = MappedDiskCache(self.path, capacity)
+        self.caches.append(cache)
+        return cache
+
+    def store(self, cache, name, body, etag=b"v1"):
+        device = cache.prepare(metadata_for(url_for(name), etag))
+        device.write(body)
+        cache.insert(device)
+
+    def body(self, cache, name):
+        device = cache.data(url_for(name))
+        if device is None:
+            return None
+        data = bytes(device.readAll())
+        device.deleteLater()
+        return data
+
+    def etag(self, cache, name):
+        headers = cache.metaData(url_for(name)).rawHeaders()
+        return {bytes(header): bytes(value) for header, value in headers}.get(b"ETag")
+
+    def test_round_trip(self):
+        cache = self.open_cache()
+        self.store(cache, "a", b"alpha")
+        self.store(cache, "b", b"b" * 5000)
+        self.assertEqual(self.body(cache, "a"), b"alpha")
+        self.assertEqual(self.body(cache, "b"), b"b" * 5000)
+        self.assertEqual(self.etag(cache, "a"), b"v1")
+        self.assertIsNone(self.body(cache, "missing"))
+        self.assertFalse(cache.metaData(url_for("missing")).isValid())
+
+    def test_reopen_scans_records(self):
+        cache = self.open_cache()
+        self.store(cache, "a", b"alpha")
+        self.store(cache, "b", b"beta")
+        self.store(cache, "a", b"alpha again")
+        end = cache.end
+
+        reopened = self.open_cache()
+        self.assertEqual(reopened.end, end)
+        self.assertEqual(self.body(reopened, "a"), b"alpha again")
+        self.assertEqual(self.body(reopened, "b"), b"beta")
+        self.assertEqual(list(reopened.index), list(cache.index))
+        self.assertEqual(reopened.live_bytes, cache.live_bytes)
+
+    def test_torn_tail_is_dropped_on_reopen(self):
+        cache = self.open_cache()
+        self.store(cache, "a", b"alpha")
+        complete = cache.end
+        self.store(cache, "b", b"b" * 1000)
+        # Pretend the process died halfway through writing the last record
+        HEADER.pack_into(cache.mapping, 0, b"SNVCACHE", 2, 0, cache.end - 500)
+
+        reopened = self.open_cache()
+        self.assertEqual(reopened.end, complete)
+        self.assertEqual(self.body(reopened, "a"), b"alpha")
+        self.assertIsNone(self.body(reopened, "b"))
+
+    def test_tombstones_survive_reopen(self):
+        cache = self.open_cache()
+        self.store(cache, "a", b"alpha")
+        self.store(cache, "b", b"beta")
+        self.assertTrue(cache.remove(url_for("a")))
+        self.assertFalse(cache.remove(url_for("a")))
+        self.assertIsNone(self.body(cache, "a"))
+
+        reopened = self.open_cache()
+        self.assertIsNone(self.body(reopened, "a"))
+        self.assertEqual(self.body(reopened, "b"), b"beta")
+
+    def test_metadata_update_does_not_copy_body(self):
+        cache = self.open_cache()
+        body = b"x" * 8000
+        self.store(cache, "a", body)
+        end = cache.end
+
+        # Same size metadata is rewritten in place
+        cache.updateMetaData(metadata_for(url_for("a"), b"v2"))
+        self.assertEqual(cache.end, end)
+        self.assertEqual(self.etag(cache, "a"), b"v2")
+
+        # Larger metadata gets a record of its own that keeps the body
+        cache.updateMetaData(metadata_for(url_for("a"), b"v3-with-a-much-longer-tag"))
+        self.assertLess(cache.end - end, len(body))
+        self.assertEqual(self.etag(cache, "a"), b"v3-with-a-much-longer-tag")
+        self.assertEqual(self.body(cache, "a"), body)
+
+        reopened = self.open_cache()
+        self.assertEqual(self.etag(reopened, "a"), b"v3-with-a-much-longer-tag")
+        self.assertEqual(self.body(reopened, "a"), body)
+        self.assertEqual(reopened.live_bytes, cache.live_bytes)
+
+    def test_compaction_keeps_live_records(self):
+        cache = self.open_cache()
+        for number in range(20):
+            self.store(cache, "churn", bytes([number]) * 3000)
+        self.store(cache, "keep", b"keep")
+        cache.updateMetaData(metadata_for(url_for("keep"), b"v2-with-a-longer-tag"))
+        cache.compact()
+
+        self.assertEqual(cache.dead_bytes(), 0)
+        self.assertEqual(self.body(cache, "churn"), bytes([19]) * 3000)
+        self.assertEqual(self.body(cache, "keep"), b"keep")
+        self.assertEqual(self.etag(cache, "keep"), b"v2-with-a-longer-tag")
+        self.assertFalse(os.path.exists(self.path + ".compact"))
+
+        reopened = self.open_cache()
+        self.assertEqual(self.body(reopened, "churn"), bytes([19]) * 3000)
+        self.assertEqual(self.etag(reopened, "keep"), b"v2-with-a-longer-tag")
+
+    def test_full_cache_evicts_oldest(self):
+        cache = self.open_cache()
+        for number in range(30):
+            self.store(cache, "entry-%d" % number, b"e" * 4000)
+        self.assertLessEqual(cache.end, cache.capacity)
+        self.assertIsNone(self.body(cache, "entry-0"))
+        self.assertEqual(self.body(cache, "entry-29"), b"e" * 4000)
+
+    def test_full_cache_compactions_are_amortized(self):
+        cache = self.open_cache()
+        compactions = metrics.value("disk_cache_compactions")
+        compacted = metrics.value("disk_cache_compacted_bytes")
+        inserts, size = 500, 1000
+        for number in range(inserts):
+            self.store(cache, "steady-%d" % number, bytes([number % 256]) * size)
+
+        # Eviction to the low-water mark leaves room for many inserts per compaction
+        self.assertLessEqual(metrics.value("disk_cache_compactions") - compactions, inserts // 10)
+        self.assertLessEqual(metrics.value("disk_cache_compacted_bytes") - compacted,
+                             4 * inserts * size)
+        self.assertEqual(self.body(cache, "steady-499"), bytes([499 % 256]) * size)
+        self.assertIsNone(self.body(cache, "steady-0"))
+
+    def test_shrinking_keeps_what_fits(self):
+        cache = self.open_cache()
+        for number in range(10):
+            self.store(cache, "entry-%d" % number, b"s" * 4000)
+        cache.setMaximumCacheSize(16 * 1024)
+
+        self.assertEqual(cache.maximumCacheSize(), 16 * 1024)
+        self.assertEqual(os.path.getsize(self.path), 16 * 1024)
+        self.assertLessEqual(cache.end, 16 * 1024)
+        kept = [number for number in range(10) if self.body(cache, "entry-%d" % number)]
+        self.assertTrue(kept)
+        self.assertEqual(kept, list(range(len(kept))))
+
+        reopened = self.open_cache(16 * 1024)
+        self.assertEqual(sorted(reopened.index), sorted(cache.index))
+
+    def test_unknown_version_is_reset(self):
+        cache = self.open_cache()
+        self.store(cache, "a", b"alpha")
+        struct.pack_into("<I", cache.mapping, 8, 1)
+
+        reopened = self.open_cache()
+        self.assertEqual(reopened.end, HEADER_SIZE)
+        self.assertIsNone(self.body(reopened, "a"))
+
+    def test_oversized_entry_is_refused(self):
+        cache = self.open_cache()
+        self.store(cache, "huge", b"h" * (CAPACITY - HEADER_SIZE - RECORD.size))
+        self.assertIsNone(self.body(cache, "huge"))
+        self.assertEqual(cache.end, HEADER_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+"""Network handlers against the stand-in server.
+
+RequestPolicy timeouts, retries, hedging and host queuing, Coalescer
+request sharing and micro-caching, and redirects through every handler
+that builds its own reply.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QUrl
+from PyQt5.QtNetwork import QNetworkReply, QNetworkRequest
+
+from benchmarks.standin import DASHBOARD, StandinServer
+from coalesce import Coalescer
+from metrics import metrics
+from netpolicy import RequestPolicy
+from network import network_manager
+from swrcache import CacheEntry, StaleWhileRevalidate, SwrRule
+
+
+def wait_until(condition, timeout_ms=5000):
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+    return condition()
+
+
+class StandinTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+        cls.server = StandinServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.manager = network_manager()
+        self.saved_handlers = self.manager.handlers
+        self.path = "/?test=%s" % self.id().rsplit(".", 1)[-1]
+
+    def tearDown(self):
+        self.manager.handlers = self.saved_handlers
+
+    def use_handlers(self, *handlers):
+        self.manager.handlers = list(handlers)
+
+    def request(self, query="", headers=()):
+        request = QNetworkRequest(QUrl(self.server.url + self.path + query))
+        for name, value in headers:
+            request.setRawHeader(name, value)
+        return request
+
+    def collect(self, reply, started=None):
+        """Wait for reply and return (reply, body, seconds taken)."""
+        started = time.monotonic() if started is None else started
+        body = bytearray()
+        reply.readyRead.connect(lambda: body.extend(bytes(reply.readAll())))
+        self.assertTrue(wait_until(reply.isFinished))
+        body.extend(bytes(reply.readAll()))
+        return reply, bytes(body), time.monotonic() - started
+
+    def get(self, query="", headers=()):
+        """Fetch the stand-in page and return (reply, body, seconds taken)."""
+        started = time.monotonic()
+        return self.collect(self.manager.get(self.request(query, headers)), started)
+
+    def hits(self, query=""):
+        return self.server.hits[self.path + query]
+
+    def status(self, reply):
+        return reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+
+
+class RequestPolicyTest(StandinTestCase):
+    def use_policy(self, **settings):
+        settings.setdefault("retry_backoff_ms", 10)
+        policy = RequestPolicy(**settings)
+        self.use_handlers(policy)
+        return policy
+
+    def test_plain_request_passes_through(self):
+        self.use_policy()
+        reply, body, _ = self.get()
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(self.status(reply), 200)
+        self.assertEqual(body, DASHBOARD)
+
+    def test_connect_timeout(self):
+        self.use_policy(connect_timeout_ms=200, retries=0, hedging=False)
+        timeouts = metrics.value("net_request_timeouts", kind="connect")
+        reply, _, seconds = self.get("&delay=2")
+        self.assertEqual(reply.error(), QNetworkReply.TimeoutError)
+        self.assertLess(seconds, 1.5)
+        self.assertEqual(metrics.value("net_request_timeouts", kind="connect"), timeouts + 1)
+
+    def test_slow_post_is_not_timed_out(self):
+        self.use_policy(connect_timeout_ms=200, retries=2, hedging=False)
+        url = QUrl(self.server.url + self.path + "&delay=0.5")
+        reply = self.manager.post(QNetworkRequest(url), b"report=1")
+        self.assertTrue(wait_until(reply.isFinished))
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(bytes(reply.readAll()), DASHBOARD)
+        self.assertEqual(self.hits("&delay=0.5"), 1)
+
+    def test_long_poll_is_not_timed_out_or_hedged(self):
+        policy = self.use_policy(connect_timeout_ms=200, hedging=True, hedge_floor_ms=50,
+                                 long_poll=["*/poll/*"])
+        host = "127.0.0.1:%d" % QUrl(self.server.url).port()
+        for _ in range(policy.latency.MIN_SAMPLES):
+            policy.latency.record(host, 0.01)
+        self.path = "/poll/events?test=long_poll"
+        self.server.httpd.pages[self.path.split("?")[0]] = ("text/plain", b"event")
+        reply, body, _ = self.get("&delay=0.5")
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(body, b"event")
+        self.assertEqual(self.hits("&delay=0.5"), 1)
+
+    def test_retry_after_connect_timeout(self):
+        self.use_policy(connect_timeout_ms=200, retries=1, hedging=False)
+        reply, body, seconds = self.get("&delay=2&delayed=1")
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(body, DASHBOARD)
+        self.assertLess(seconds, 1.5)
+        self.assertEqual(self.hits("&delay=2&delayed=1"), 2)
+
+    def test_retry_on_unavailable(self):
+        self.use_policy(retries=2, hedging=False)
+        retries = metrics.value("net_request_retries")
+        reply, body, _ = self.get("&fail=2")
+        self.assertEqual(self.status(reply), 200)
+        self.assertEqual(body, DASHBOARD)
+        self.assertEqual(self.hits("&fail=2"), 3)
+        self.assertEqual(metrics.value("net_request_retries"), retries + 2)
+
+    def test_retries_run_out(self):
+        self.use_policy(retries=1, hedging=False)
+        reply, _, _ = self.get("&fail=5")
+        self.assertEqual(self.status(reply), 503)
+        self.assertEqual(self.hits("&fail=5"), 2)
+
+    def test_read_timeout_is_not_retried(self):
+        self.use_policy(read_timeout_ms=200, retries=2, hedging=False)
+        timeouts = metrics.value("net_request_timeouts", kind="read")
+        reply, body, seconds = self.get("&stall=2")
+        self.assertEqual(reply.error(), QNetworkReply.TimeoutError)
+        self.assertEqual(self.status(reply), 200)
+        self.assertEqual(body, DASHBOARD[:len(DASHBOARD) // 2])
+        self.assertLess(seconds, 1.5)
+        self.assertEqual(self.hits("&stall=2"), 1)
+        self.assertEqual(metrics.value("net_request_timeouts", kind="read"), timeouts + 1)
+
+    def test_slow_request_is_hedged(self):
+        policy = self.use_policy(hedging=True, hedge_floor_ms=100)
+        host = "127.0.0.1:%d" % QUrl(self.server.url).port()
+        for _ in range(policy.latency.MIN_SAMPLES):
+            policy.latency.record(host, 0.01)
+        wins = metrics.value("net_hedge_wins", attempt="hedge")
+
+        reply, body, seconds = self.get("&delay=2&delayed=1")
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(body, DASHBOARD)
+        self.assertLess(seconds, 1.5)
+        self.assertEqual(self.hits("&delay=2&delayed=1"), 2)
+        self.assertEqual(metrics.value("net_hedge_wins", attempt="hedge"), wins + 1)
+
+    def test_no_hedge_without_latency_history(self):
+        self.use_policy(hedging=True, hedge_floor_ms=50)
+        reply, _, _ = self.get("&delay=0.3")
+        self.assertEqual(reply.error(), QNetworkReply.NoError)
+        self.assertEqual(self.hits("&delay=0.3"), 1)
+
+    def test_requests_queue_per_host(self):
+        self.use_policy(host_limit=2, hedging=False)
+        # Attempts dropped by earlier tests may still be sleeping on the server
+        wait_until(lambda: self.server.httpd.in_flight == 0)
+        self.server.httpd.peak_in_flight = 0
+        replies = [self.manager.get(QNetworkRequest(
+            QUrl("%s%s&delay=0.3&n=%d" % (self.server.url, self.path, number))))
+            for number in range(5)]
+        self.assertTrue(wait_until(lambda: all(reply.isFinished() for reply in replies)))
+        self.assertTrue(all(reply.error() == QNetworkReply.NoError for reply in replies))
+        self.assertEqual(self.server.peak_in_flight, 2)
+
+    def test_canceled_request_frees_its_host_slot(self):
+        self.use_policy(host_limit=1, hedging=False)
+        slow = self.manager.get(QNetworkRequest(QUrl(self.server.url + self.path + "&delay=2")))
+        wait_until(lambda: self.hits("&delay=2"), 1000)
+        slow.abort()
+        reply, body, seconds = self.get()
+        self.assertEqual(body, DASHBOARD)
+        self.assertLess(seconds, 1.5)
+
+
+class CoalescerTest(StandinTestCase):
+    def concurrent(self, *requests):
+        replies = [self.manager.get(request) for request in requests]
+        return [self.collect(reply)[1] for reply in replies]
+
+    def test_identical_gets_share_one_upstream_request(self):
+        self.use_handlers(Coalescer())
+        coalesced = metrics.value("net_coalesced_requests")
+        bodies = self.concurrent(self.request("&delay=0.3"), self.request("&delay=0.3"))
+        self.assertEqual(bodies, [DASHBOARD, DASHBOARD])
+        self.assertEqual(self.hits("&delay=0.3"), 1)
+        self.assertEqual(metrics.value("net_coalesced_requests"), coalesced + 1)
+
+    def test_other_origins_are_not_shared(self):
+        self.use_handlers(Coalescer())
+        self.concurrent(self.request("&delay=0.3", [(b"Origin", b"http://a.example")]),
+                        self.request("&delay=0.3", [(b"Origin", b"http://b.example")]))
+        self.assertEqual(self.hits("&delay=0.3"), 2)
+
+    def test_custom_headers_are_not_shared(self):
+        self.use_handlers(Coalescer())
+        self.concurrent(self.request("&delay=0.3", [(b"X-API-Key", b"tab-1")]),
+                        self.request("&delay=0.3", [(b"X-API-Key", b"tab-1")]))
+        self.assertEqual(self.hits("&delay=0.3"), 2)
+
+    def test_conditional_get_does_not_join(self):
+        # A revalidation that joined a plain GET would get a 200 it never asked for
+        self.use_handlers(Coalescer())
+        self.concurrent(self.request("&delay=0.3"),
+                        self.request("&delay=0.3", [(b"If-None-Match", b'"v1"')]))
+        self.assertEqual(self.hits("&delay=0.3"), 2)
+
+    def test_micro_cache_reuses_recent_responses(self):
+        self.path = "/micro?test=micro_cache"
+        self.server.httpd.pages["/micro"] = ("application/json", b"{}")
+        self.use_handlers(Coalescer([("*/micro", 30.0)]))
+        micro_hits = metrics.value("net_micro_cache_hits")
+        for _ in range(3):
+            reply, body, _ = self.get()
+            self.assertEqual(self.status(reply), 200)
+            self.assertEqual(body, b"{}")
+        self.assertEqual(self.hits(), 1)
+        self.assertEqual(metrics.value("net_micro_cache_hits"), micro_hits + 2)
+
+    def test_micro_cache_skips_unlisted_urls(self):
+        self.use_handlers(Coalescer([("*/micro", 30.0)]))
+        self.get()
+        self.get()
+        self.assertEqual(self.hits(), 2)
+
+
+class RedirectTest(StandinTestCase):
+    QUERY = "&redirect=/elsewhere"
+
+    def assert_redirected(self, reply):
+        self.assertEqual(self.status(reply), 302)
+        self.assertEqual(reply.attribute(QNetworkRequest.RedirectionTargetAttribute),
+                         QUrl("/elsewhere"))
+
+    def test_through_request_policy(self):
+        self.use_handlers(RequestPolicy(hedging=False))
+        self.assert_redirected(self.get(self.QUERY)[0])
+
+    def test_through_coalescer(self):
+        self.use_handlers(Coalescer())
+        self.assert_redirected(self.get(self.QUERY)[0])
+
+    def test_through_the_whole_chain(self):
+        self.use_handlers(StaleWhileRevalidate([SwrRule("*", 60.0, 60.0)], 1024 * 1024),
+                          Coalescer(), RequestPolicy(hedging=False))
+        self.assert_redirected(self.get(self.QUERY)[0])
+
+    def test_served_from_swr_store(self):
+        swr = StaleWhileRevalidate([SwrRule("*", 60.0, 60.0)], 1024 * 1024)
+        request = self.request(self.QUERY)
+        swr.store.put(request.url().toString(QUrl.RemoveFragment),
+                      CacheEntry(302, b"Found", [(b"Location", b"/elsewhere")], b""))
+        self.use_handlers(swr)
+        reply, _, _ = self.collect(self.manager.get(request))
+        self.assert_redirected(reply)
+        self.assertEqual(self.hits(self.QUERY), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+"""Replay of the session journal and the snapshot it is compacted into.
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QCoreApplication, QObject, QPoint, QUrl, pyqtSignal
+
+from session import SessionJournal, SessionState, read_journal
+from tabs import TabRecord
+
+
+class StandinRegistry(QObject):
+    """The parts of TabRegistry a SessionJournal reads, without any views."""
+
+    tab_opened = pyqtSignal(object, int)
+    tab_closed = pyqtSignal(object)
+    tab_moved = pyqtSignal(int, int)
+    tab_navigated = pyqtSignal(object)
+    tab_activated = pyqtSignal(object)
+
+    def __init__(self):
+        super(StandinRegistry, self).__init__()
+        self.records = []
+        self.current = None
+        self.tabs = self
+
+    def count(self):
+        return len(self.records)
+
+    def record_at(self, index):
+        return self.records[index]
+
+    def current_record(self):
+        return self.current
+
+    def open(self, url, title, index=None):
+        record = TabRecord(QUrl(url), title)
+        index = len(self.records) if index is None else index
+        self.records.insert(index, record)
+        self.tab_opened.emit(record, index)
+        return record
+
+    def close(self, record):
+        self.records.remove(record)
+        if self.current is record:
+            self.current = None
+        self.tab_closed.emit(record)
+
+    def navigate(self, record, url, title):
+        record.url = QUrl(url)
+        record.title = title
+        self.tab_navigated.emit(record)
+
+    def move(self, source, target):
+        self.records.insert(target, self.records.pop(source))
+        self.tab_moved.emit(source, target)
+
+    def activate(self, record):
+        self.current = record
+        self.tab_activated.emit(record)
+
+
+class SessionStateTest(unittest.TestCase):
+    def replay(self, *events):
+        state = SessionState()
+        for event in events:
+            state.apply(event)
+        return state
+
+    def urls(self, state):
+        return [tab["url"] for tab in state.tabs]
+
+    def test_open_inserts_at_index(self):
+        state = self.replay({"op": "open", "id": 1, "url": "http://a/", "title": "A"},
+                            {"op": "open", "id": 2, "url": "http://b/"},
+                            {"op": "open", "id": 3, "url": "http://c/", "index": 0},
+                            {"op": "open", "id": 4, "url": "http://d/", "index": 99})
+        self.assertEqual(self.urls(state), ["http://c/", "http://a/", "http://b/", "http://d/"])
+        self.assertEqual(state.tabs[1], {"id": 1, "url": "http://a/", "title": "A",
+                                         "scroll": [0, 0]})
+
+    def test_close_navigate_and_scroll_address_tabs_by_id(self):
+        state = self.replay({"op": "open", "id": 1, "url": "http://a/"},
+                            {"op": "open", "id": 2, "url": "http://b/"},
+                            {"op": "navigate", "id": 2, "url": "http://b/next", "title": "B"},
+                            {"op": "scroll", "id": 2, "x": 0, "y": 640},
+                            {"op": "close", "id": 1},
+                            {"op": "close", "id": 7},
+                            {"op": "navigate", "id": 7, "url": "http://gone/"})
+        self.assertEqual(state.tabs, [{"id": 2, "url": "http://b/next", "title": "B",
+                                       "scroll": [0, 640]}])
+
+    def test_move_reorders_by_position(self):
+        state = self.replay({"op": "open", "id": 1, "url": "http://a/"},
+                            {"op": "open", "id": 2, "url": "http://b/"},
+                            {"op": "open", "id": 3, "url": "http://c/"},
+                            {"op": "move", "from": 0, "to": 2},
+                            {"op": "move", "from": 5, "to": 0})
+        self.assertEqual(self.urls(state), ["http://b/", "http://c/", "http://a/"])
+
+    def test_activate_follows_the_tab_not_its_position(self):
+        state = self.replay({"op": "open", "id": 1, "url": "http://a/"},
+                            {"op": "open", "id": 2, "url": "http://b/"},
+                            {"op": "activate", "id": 2},
+                            {"op": "move", "from": 1, "to": 0})
+        self.assertEqual(state.active_index(), 0)
+        state.apply({"op": "close", "id": 2})
+        self.assertEqual(state.active_index(), 0)
+
+    def test_snapshot_replaces_everything_before_it(self):
+        state = self.replay({"op": "open", "id": 1, "url": "http://old/"},
+                            {"op": "snapshot", "active": 6,
+                             "tabs": [{"id": 5, "url": "http://a/", "title": "A",
+                                       "scroll": [0, 0]},
+                                      {"id": 6, "url": "http://b/", "title": "B",
+                                       "scroll": [10, 20]}]})
+        self.assertEqual(self.urls(state), ["http://a/", "http://b/"])
+        self.assertEqual(state.active_index(), 1)
+        self.assertEqual(state.entries()[1], (QUrl("http://b/"), "B", QPoint(10, 20)))
+
+
+class SessionJournalTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="supernova-session-test-")
+        self.path = os.path.join(self.directory, "session.journal")
+        self.registry = StandinRegistry()
+        self.journal = SessionJournal(self.path)
+
+    def tearDown(self):
+        self.journal.flush_timer.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def lines(self):
+        with open(self.path, encoding="utf-8") as journal:
+            return [json.loads(line) for line in journal]
+
+    def test_attach_writes_a_snapshot(self):
+        first = self.registry.open("http://a/", "A")
+        self.registry.open("http://b/", "B")
+        self.registry.activate(first)
+        first.scroll_position = QPoint(0, 300)
+        self.journal.attach(self.registry)
+
+        self.assertEqual(self.lines(), [{
+            "op": "snapshot", "active": first.id,
+            "tabs": [{"id": first.id, "url": "http://a/", "title": "A", "scroll": [0, 300]},
+                     {"id": self.registry.records[1].id, "url": "http://b/", "title": "B",
+                      "scroll": [0, 0]}]}])
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_replay_matches_the_registry(self):
+        self.journal.attach(self.registry)
+        first = self.registry.open("http://a/", "A")
+        second = self.registry.open("http://b/", "B")
+        third = self.registry.open("http://c/", "C", index=0)
+        self.registry.activate(first)
+        self.registry.navigate(second, "http://b/next", "B2")
+        self.registry.move(0, 2)
+        first.scroll_position = QPoint(0, 480)
+        self.registry.activate(second)
+        self.registry.close(third)
+        self.journal.close()
+
+        state = read_journal(self.path)
+        self.assertEqual(state.tabs, [
+            {"id": first.id, "url": "http://a/", "title": "A", "scroll": [0, 480]},
+            {"id": second.id, "url": "http://b/next", "title": "B2", "scroll": [0, 0]}])
+        self.assertEqual(state.active_index(), 1)
+
+    def test_torn_last_line_is_ignored(self):
+        self.journal.attach(self.registry)
+        self.registry.open("http://a/", "A")
+        self.registry.open("http://b/", "B")
+        self.journal.flush()
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write('{"op":"close","i')
+
+        state = read_journal(self.path)
+        self.assertEqual([tab["url"] for tab in state.tabs], ["http://a/", "http://b/"])
+
+    def test_long_journal_is_compacted_into_one_snapshot(self):
+        self.journal.attach(self.registry)
+        record = self.registry.open("http://a/", "A")
+        self.registry.activate(record)
+        for number in range(SessionJournal.COMPACT_LINES):
+            self.registry.navigate(record, "http://a/%d" % number, "A%d" % number)
+            if number % 100 == 0:
+                self.journal.flush()
+        self.journal.flush()
+
+        lines = self.lines()
+        self.assertEqual([line["op"] for line in lines], ["snapshot"])
+        state = read_journal(self.path)
+        last = SessionJournal.COMPACT_LINES - 1
+        self.assertEqual(state.tabs, [{"id": record.id, "url": "http://a/%d" % last,
+                                       "title": "A%d" % last, "scroll": [0, 0]}])
+        self.assertEqual(state.active_index(), 0)
+
+    def test_missing_journal_is_an_empty_session(self):
+        state = read_journal(os.path.join(self.directory, "missing.journal"))
+        self.assertEqual(state.tabs, [])
+        self.assertEqual(state.entries(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
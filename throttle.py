@@ -0,0 +1,94 @@
+import fnmatch
+
+from PyQt5.QtCore import QObject
+
+from metrics import metrics
+from suspend import PAUSED, RUNNING, set_page_throttle
+
+
+THROTTLE_MODES = ("none", "hidden", "clamp", "pause")
+
+
+class BackgroundThrottler(QObject):
+    """Throttles tabs while another tab is in front.
+
+    Modes, from lightest to strongest:
+      none    the tab keeps running as if it were visible
+      hidden  the page is told it is hidden, timers keep their rate
+      clamp   hidden, and timers and animation frames fire at most once per period ms
+      pause   hidden, and timers, animation frames and CSS animations stop
+
+    A tab's own record.throttle wins over the first matching URL rule,
+    which wins over the default mode. The foreground tab is released before
+    the previous one is throttled, so switching tabs never waits on it.
+    """
+
+    def __init__(self, registry, mode="clamp", period=1000, rules=(), parent=None):
+        super(BackgroundThrottler, self).__init__(parent)
+        self.registry = registry
+        self.mode = mode
+        self.period = period
+        self.rules = list(rules)
+        self.foreground = None
+        registry.tab_activated.connect(self.tab_activated)
+        registry.tab_closed.connect(self.tab_closed)
+
+    def mode_for(self, record):
+        if record.throttle is not None:
+            return record.throttle
+        address = record.url.toString()
+        for pattern, mode in self.rules:
+            if fnmatch.fnmatchcase(address, pattern):
+                return mode
+        return self.mode
+
+    def background_state(self, record):
+        mode = self.mode_for(record)
+        if mode == "none":
+            return RUNNING, False
+        if mode == "hidden":
+            return RUNNING, True
+        if mode == "clamp":
+            return self.period, True
+        return PAUSED, True
+
+    def state_for(self, record):
+        if record is self.foreground:
+            return RUNNING, False
+        return self.background_state(record)
+
+    def apply(self, record):
+        if record.view is not None:
+            set_page_throttle(record.view.page(), *self.state_for(record))
+
+    def apply_all(self):
+        """Reassert every live view's throttle state, e.g. after an idle period."""
+        for record in list(self.registry.views.values()):
+            self.apply(record)
+
+    def tab_activated(self, record):
+        previous, self.foreground = self.foreground, record
+        self.apply(record)
+        if previous is not None and previous is not record:
+            self.apply(previous)
+            if previous.view is not None:
+                metrics.inc("tabs_throttled", mode=self.mode_for(previous))
+
+    def tab_closed(self, record):
+        if record is self.foreground:
+            self.foreground = None
+
+    def set_tab_mode(self, record, mode):
+        """Override the mode of one tab; None returns it to the rules."""
+        record.throttle = mode
+        self.apply(record)
+
+
+def parse_throttle_rules(rules):
+    """Build (pattern, mode) pairs from (pattern, [mode]) rules."""
+    parsed = []
+    for pattern, values in rules:
+        if not values or values[0] not in THROTTLE_MODES:
+            raise ValueError("throttle rule %r needs one of %s" % (pattern, ", ".join(THROTTLE_MODES)))
+        parsed.append((pattern, values[0]))
+    return parsed
@@ -0,0 +1,184 @@
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+
+from PyQt5.QtCore import QEvent
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest
+from PyQt5.QtWidgets import QApplication
+
+from metrics import metrics
+
+
+OPERATIONS = {
+    QNetworkAccessManager.HeadOperation: "HEAD",
+    QNetworkAccessManager.GetOperation: "GET",
+    QNetworkAccessManager.PutOperation: "PUT",
+    QNetworkAccessManager.PostOperation: "POST",
+    QNetworkAccessManager.DeleteOperation: "DELETE",
+    QNetworkAccessManager.CustomOperation: "CUSTOM",
+}
+EVENT_NAMES = {value: name for name, value in vars(QEvent).items()
+               if isinstance(value, QEvent.Type)}
+
+
+def timestamp():
+    return int(time.perf_counter() * 1000000)
+
+
+class Tracer(object):
+    """Collects Chrome trace events into a ring buffer.
+
+    Events are plain dicts appended on the GUI thread; a writer thread
+    drains the buffer to a JSON array file every FLUSH_INTERVAL seconds.
+    When the writer falls behind, the oldest events are dropped. Until
+    start() is called every method returns immediately.
+    """
+
+    CAPACITY = 65536
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self):
+        self.enabled = False
+        self.events = collections.deque(maxlen=self.CAPACITY)
+        self.pid = os.getpid()
+        self.ids = itertools.count(1)
+        self.writer = None
+
+    def start(self, path):
+        self.writer = TraceWriter(self, path)
+        self.writer.start()
+        self.enabled = True
+        self.add({"ph": "M", "name": "process_name", "args": {"name": "supernova-surfer"}})
+
+    def stop(self):
+        if self.writer is not None:
+            self.enabled = False
+            self.writer.stop()
+            self.writer.join()
+            self.writer = None
+
+    def add(self, event):
+        if len(self.events) == self.CAPACITY:
+            metrics.inc("trace_events_dropped")
+        event["pid"] = self.pid
+        event.setdefault("tid", threading.get_ident())
+        event.setdefault("ts", timestamp())
+        self.events.append(event)
+
+    def instant(self, name, category, **args):
+        if self.enabled:
+            self.add({"ph": "i", "s": "t", "name": name, "cat": category, "args": args})
+
+    def complete(self, name, category, start, **args):
+        if self.enabled:
+            self.add({"ph": "X", "name": name, "cat": category, "ts": start,
+                      "dur": timestamp() - start, "args": args})
+
+    def counter(self, name, category, **values):
+        if self.enabled:
+            self.add({"ph": "C", "name": name, "cat": category, "args": values})
+
+    def begin(self, name, category, event_id, **args):
+        if self.enabled:
+            self.add({"ph": "b", "name": name, "cat": category, "id": event_id, "args": args})
+
+    def end(self, name, category, event_id, **args):
+        if self.enabled:
+            self.add({"ph": "e", "name": name, "cat": category, "id": event_id, "args": args})
+
+    def traced(self, name, category, function):
+        """Wrap function so each call is recorded as a complete event."""
+        def call(*args):
+            if not self.enabled:
+                return function(*args)
+            start = timestamp()
+            try:
+                return function(*args)
+            finally:
+                self.complete(name, category, start)
+        return call
+
+    def next_id(self):
+        return next(self.ids)
+
+
+class TraceWriter(threading.Thread):
+    def __init__(self, tracer, path):
+        super(TraceWriter, self).__init__(name="trace-writer", daemon=True)
+        self.tracer = tracer
+        self.path = path
+        self.stopped = threading.Event()
+
+    def run(self):
+        with open(self.path, "w", encoding="utf-8") as output:
+            output.write("[\n")
+            while not self.stopped.wait(self.tracer.FLUSH_INTERVAL):
+                self.drain(output)
+            self.drain(output)
+            output.write(json.dumps({"ph": "M", "name": "trace_end", "pid": self.tracer.pid,
+                                     "tid": 0, "ts": timestamp(), "args": {}}))
+            output.write("\n]\n")
+
+    def drain(self, output):
+        events = self.tracer.events
+        lines = []
+        while events:
+            lines.append(json.dumps(events.popleft(), separators=(",", ":")) + ",\n")
+        if lines:
+            output.write("".join(lines))
+            output.flush()
+
+    def stop(self):
+        self.stopped.set()
+
+
+tracer = Tracer()
+
+
+def trace_view(view, record):
+    """Record a tab's page loads as async events on the tab's own track."""
+    track = "tab %d" % record.id
+    view.loadStarted.connect(
+        lambda: tracer.begin("load", track, record.id, url=view.url().toString()))
+    view.loadProgress.connect(lambda progress: tracer.counter(track + " progress", "page",
+                                                              progress=progress))
+    view.loadFinished.connect(
+        lambda ok: tracer.end("load", track, record.id, ok=ok, url=view.url().toString()))
+
+
+class TraceHandler(object):
+    """Network handler recording each request's lifecycle as an async event."""
+
+    def handle(self, operation, request, data, forward):
+        reply = forward(operation, request, data)
+        event_id = tracer.next_id()
+        name = OPERATIONS.get(operation, "REQUEST")
+        tracer.begin(name, "network", event_id, url=request.url().toString())
+        reply.metaDataChanged.connect(lambda: tracer.instant(
+            "headers", "network", id=event_id,
+            status=reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)))
+        reply.finished.connect(lambda: tracer.end(
+            name, "network", event_id, error=int(reply.error()),
+            status=reply.attribute(QNetworkRequest.HttpStatusCodeAttribute),
+            from_cache=bool(reply.attribute(QNetworkRequest.SourceIsFromCacheAttribute))))
+        return reply
+
+
+class TracingApplication(QApplication):
+    """QApplication that traces event dispatches slower than SLOW_DISPATCH_MS."""
+
+    SLOW_DISPATCH_MS = 16
+
+    def notify(self, receiver, event):
+        start = timestamp()
+        kind = event.type()
+        try:
+            return super(TracingApplication, self).notify(receiver, event)
+        finally:
+            if timestamp() - start >= self.SLOW_DISPATCH_MS * 1000:
+                # type() still works if the receiver was deleted by this very event
+                tracer.complete(EVENT_NAMES.get(kind, "Event %d" % kind), "dispatch", start,
+                                receiver=type(receiver).__name__)
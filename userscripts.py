@@ -0,0 +1,59 @@
+import json
+import os
+from PyQt5.QtCore import QObject
+
+
+class UserScript(object):
+    """A page script read once and re-read only when its file's mtime changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mtime = None
+        self.source = None
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self.mtime = self.source = None
+            return False
+        if mtime != self.mtime:
+            with open(self.path, encoding="utf-8") as script:
+                self.source = self.wrap(script.read())
+            self.mtime = mtime
+        return True
+
+    def wrap(self, source):
+        # Guard so a document only ever gets the script once
+        key = json.dumps(self.name)
+        return ("(function () {\n"
+                "var loaded = window.__supernovaUserScripts = window.__supernovaUserScripts || {};\n"
+                "if (loaded[%s]) { return; }\n"
+                "loaded[%s] = true;\n"
+                "%s\n"
+                "})();" % (key, key, source))
+
+
+class UserScriptManager(QObject):
+    """Injects user scripts into every main frame once its document has loaded."""
+
+    def __init__(self, paths, parent=None):
+        super(UserScriptManager, self).__init__(parent)
+        self.scripts = [UserScript(path) for path in paths]
+
+    def script(self, name):
+        for script in self.scripts:
+            if script.name == name:
+                return script
+        return None
+
+    def watch_view(self, view):
+        frame = view.page().mainFrame()
+        frame.loadFinished.connect(lambda ok: self.inject(frame))
+
+    def inject(self, frame):
+        for script in self.scripts:
+            if script.refresh():
+                frame.evaluateJavaScript(script.source)
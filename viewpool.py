@@ -0,0 +1,80 @@
+import time
+from PyQt5.QtCore import QObject, QTimer
+
+from metrics import metrics
+from suspend import PAUSED, RUNNING, set_page_throttle
+from tabs import teardown_view
+
+
+class ViewPool(QObject):
+    """Keeps a few views that have already loaded the home page in the background.
+
+    New home tabs adopt a warm view instead of building one and waiting for
+    the first paint; the pool is topped up again one view per idle tick.
+    Pooled views are paused once loaded, so no one polls the backend from
+    a page nobody sees, and resumed when a tab adopts them.
+    """
+
+    REFILL_DELAY_MS = 1000
+
+    def __init__(self, view_factory, url, size=1, parent=None, start=True):
+        super(ViewPool, self).__init__(parent)
+        self.view_factory = view_factory
+        self.url = url
+        self.size = size
+        self.views = []
+        self.started = start
+
+        self.refill_timer = QTimer(self)
+        self.refill_timer.setSingleShot(True)
+        self.refill_timer.timeout.connect(self.refill)
+
+        metrics.set("view_pool_size", size)
+        self.report()
+        self.schedule_refill()
+
+    def start(self):
+        """Begin warming views, e.g. once the backend answers."""
+        self.started = True
+        self.schedule_refill()
+
+    def acquire(self, url, allow_warm=True):
+        """Return (view, warm); a warm view has already loaded url."""
+        if allow_warm and self.views and url == self.url:
+            view, created = self.views.pop(0)
+            set_page_throttle(view.page(), RUNNING)
+            metrics.inc("view_pool_hits")
+            metrics.observe("view_pool_view_age_seconds", time.monotonic() - created,
+                            buckets=(1, 10, 60, 300, 900, 3600))
+            self.report()
+            self.schedule_refill()
+            return view, True
+
+        if self.size:
+            metrics.inc("view_pool_misses")
+        return self.view_factory(), False
+
+    def schedule_refill(self):
+        if self.started and len(self.views) < self.size and not self.refill_timer.isActive():
+            self.refill_timer.start(self.REFILL_DELAY_MS)
+
+    def refill(self):
+        view = self.view_factory()
+        view.loadFinished.connect(lambda ok: self.park(view))
+        self.views.append((view, time.monotonic()))
+        view.setUrl(self.url)
+        self.report()
+        self.schedule_refill()
+
+    def park(self, view):
+        if any(pooled is view for pooled, _ in self.views):
+            set_page_throttle(view.page(), PAUSED)
+
+    def clear(self):
+        self.refill_timer.stop()
+        while self.views:
+            teardown_view(self.views.pop()[0])
+        self.report()
+
+    def report(self):
+        metrics.set("view_pool_ready", len(self.views))
@@ -0,0 +1,128 @@
+import collections
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+
+from PyQt5.QtCore import QObject, QTimer, Qt
+
+from metrics import metrics
+from network import cache_directory
+
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LagMonitor(QObject):
+    """Heartbeat on the GUI event loop that measures how late it runs.
+
+    Each beat records how far past its due time it fired, and publishes
+    the beat time for StallWatchdog. Lag percentiles over the last WINDOW
+    beats are refreshed as gauges every REPORT_EVERY beats, along with the
+    tab URLs the watchdog reports, since it cannot touch Qt objects itself.
+    """
+
+    INTERVAL_MS = 250
+    WINDOW = 240
+    REPORT_EVERY = 20
+
+    def __init__(self, tab_urls=lambda: (), parent=None):
+        super(LagMonitor, self).__init__(parent)
+        self.tab_urls = tab_urls
+        self.last_tab_urls = ()
+        self.samples = collections.deque(maxlen=self.WINDOW)
+        self.beats = 0
+        self.last_beat = time.monotonic()
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.beat)
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.timer.start(self.INTERVAL_MS)
+
+    def stop(self):
+        self.timer.stop()
+
+    def beat(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self.last_beat - self.INTERVAL_MS / 1000.0)
+        self.last_beat = now
+        self.samples.append(lag)
+        metrics.observe("event_loop_lag_seconds", lag, LAG_BUCKETS)
+        self.beats += 1
+        if self.beats % self.REPORT_EVERY == 0:
+            self.report()
+
+    def report(self):
+        self.last_tab_urls = tuple(self.tab_urls())
+        ordered = sorted(self.samples)
+        for quantile in LAG_QUANTILES:
+            index = min(len(ordered) - 1, int(len(ordered) * quantile))
+            metrics.set("event_loop_lag_quantile_seconds", ordered[index], quantile=str(quantile))
+
+
+class StallWatchdog(threading.Thread):
+    """Watches the LagMonitor heartbeat from a thread of its own.
+
+    When the GUI thread has not beaten for threshold seconds, the stacks of
+    all Python threads and the open tab URLs are written to a rotating log,
+    once per stall.
+    """
+
+    MAX_LOG_BYTES = 1024 * 1024
+    LOG_BACKUPS = 3
+
+    def __init__(self, monitor, threshold, path=None):
+        super(StallWatchdog, self).__init__(name="stall-watchdog", daemon=True)
+        self.monitor = monitor
+        self.threshold = threshold
+        self.path = path or os.path.join(os.path.dirname(cache_directory()), "stalls.log")
+        self.stopped = threading.Event()
+        self.logger = None
+
+    def run(self):
+        reported = None
+        while not self.stopped.wait(self.threshold / 4.0):
+            beat = self.monitor.last_beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold:
+                reported = None
+            elif reported != beat:
+                reported = beat
+                metrics.inc("event_loop_stalls")
+                self.dump(stalled)
+
+    def stop(self):
+        self.stopped.set()
+
+    def dump(self, stalled):
+        lines = ["GUI thread stalled for %.1f s" % stalled, "", "Tabs:"]
+        lines.extend("  " + url for url in self.monitor.last_tab_urls)
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            lines.append("")
+            lines.append("Thread %s (%s):" % (names.get(ident, "unknown"), ident))
+            lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        try:
+            self.log().warning("\n".join(lines))
+        except OSError:
+            pass
+
+    def log(self):
+        if self.logger is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.MAX_LOG_BYTES, backupCount=self.LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s\n"))
+            self.logger = logging.getLogger("supernova.watchdog")
+            self.logger.propagate = False
+            self.logger.addHandler(handler)
+        return self.logger